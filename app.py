@@ -1,12 +1,18 @@
 import os
 import time
 
-from flask import Flask, render_template, request, redirect, url_for
-from forms import WorldSizeForm
-
-from game_of_life import GameOfLife, NoGenerationError
-from helpers import open_session, get_window_screen_size, invalid_parameter_message, render_plain_world
+from flask import Flask, render_template, request, redirect, url_for, g, Response, send_from_directory
+from forms import WORLD_MAX_SIZE, WORLD_MIN_SIZE, WorldSizeForm
+
+from game_of_life import GameOfLife, NoGenerationError, CellState
+from helpers import (open_session, get_window_screen_size, invalid_parameter_message, render_plain_worlds,
+                     render_world_stream, render_png_world, render_world_page, get_cached_response, cache_response,
+                     plain_world_format)
+from util.metrics import REGISTRY, CONTENT_TYPE, Histogram
+from util.profiler import PROFILE_HEADER, create_request_profiler
 from util.session import SessionService
+from world.patterns import PATTERN_FORMATS, PatternError
+from world.rules import CONWAY, RuleError, parse_rule
 
 app = Flask(__name__)
 
@@ -17,6 +23,7 @@ if app.debug:
 app.jinja_options["trim_blocks"] = True
 app.jinja_options["lstrip_blocks"] = True
 app.jinja_options["keep_trailing_newline"] = True
+app.jinja_env.globals["CellState"] = CellState
 
 # Tell browser to don't cache anything
 if int(os.environ.get('NO_CACHE', '0')):
@@ -27,7 +34,86 @@ if int(os.environ.get('NO_CACHE', '0')):
         response.headers["Pragma"] = "no-cache"
         return response
 
-_GAME_VIEWS = ('live', 'world', 'plain_world')
+# The latency of the streams is the time to the start of the stream
+_REQUEST_SECONDS = Histogram('life_request_seconds', "Latency of the requests by the view", ('view',))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def observe_request_latency(response):
+    # the views of the game are labeled by the view, the other ones by the endpoint
+    view = g.get('view') or request.endpoint or 'unknown'
+    _REQUEST_SECONDS.labels(view).observe(time.perf_counter() - g.request_start)
+    return response
+
+
+# Profile the requests sampled by the rate or marked by the header (see `util.profiler`)
+_PROFILER = create_request_profiler(app.debug)
+if _PROFILER is not None:
+    _NOT_PROFILED_ENDPOINTS = ('profiles', 'profile_file', 'static')
+
+    @app.before_request
+    def start_profile():
+        if request.endpoint in _NOT_PROFILED_ENDPOINTS:
+            return
+        if _PROFILER.should_profile(request.headers.get(PROFILE_HEADER)):
+            g.profile = _PROFILER.start()
+            g.profile_start = time.perf_counter()
+
+    # The profile of a stream ends when the stream starts
+    @app.after_request
+    def stop_profile(response):
+        _write_profile(response.status_code, None)
+        return response
+
+    @app.teardown_request
+    def stop_failed_profile(exc):
+        _write_profile(500, exc)
+
+    def _write_profile(status: int, exc) -> None:
+        profile = g.pop('profile', None)
+        if profile is not None:
+            # the views of the game set the world size and the serial
+            info = dict(method=request.method, url=request.full_path, endpoint=request.endpoint, view=g.get('view'),
+                        world_size=g.get('world_size'), serial=g.get('serial'), status=status,
+                        error=repr(exc) if exc else None, seconds=time.perf_counter() - g.profile_start)
+            _PROFILER.stop(profile, info)
+
+    if _PROFILER.public:
+        # The last profiles, the last first: time, seconds, status, world size, serial, URL and the profile
+        @app.route("/profiles")
+        def profiles():
+            lines = []
+            for info in _PROFILER.recent_profiles():
+                ended = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['time']))
+                lines.append(f"{ended} {info['seconds']:8.3f} {info['status']} {info['world_size'] or '-':>9}"
+                             f" {'-' if info['serial'] is None else info['serial']:>6} {info['method']} {info['url']}"
+                             f" {url_for('profile_file', name=info['name'])}")
+            return Response("\n".join(lines) + "\n", mimetype="text/plain")
+
+        @app.route("/profiles/<name>")
+        def profile_file(name):
+            return send_from_directory(_PROFILER.directory, name, mimetype="application/octet-stream",
+                                       as_attachment=True)
+
+
+_GAME_VIEWS = ('live', 'world', 'plain_world', 'png')
+
+# The largest size of a cell in the "png" view (pixels)
+_MAX_PNG_CELL_SIZE = 32
+
+# Maximum number of generations in one response of the "plain_world" view
+_MAX_FRAME_BATCH = int(os.environ.get('MAX_FRAME_BATCH', 100))
+
+# Minimal period (ms) of the generations in the stream, the same as in live.js
+_MIN_UPDATE_PERIOD = 100
+
+# The parameters of the rectangle of the world to show (see `CellGeneration.get_window`): name -> (argument, minimum)
+_VIEWPORT_PARAMS = {'x': ('x', 0), 'y': ('y', 0), 'w': ('width', 1), 'h': ('height', 1), 'scale': ('scale', 1)}
 
 
 @app.route("/check-session")
@@ -46,22 +132,24 @@ def check_session():
 @app.route("/", methods=("GET", "POST"))
 @open_session
 def index(context):
-    form = WorldSizeForm(context)
+    with context:
+        form = WorldSizeForm(context)
 
-    if form.validate_on_submit():
-        GameOfLife(context).create_new_random_life(width=form.width.data, height=form.height.data)
+        if form.validate_on_submit():
+            GameOfLife(context).create_new_random_life(width=form.width.data, height=form.height.data,
+                                                       rule=parse_rule(form.rule.data))
 
-        if form.js_off.data:
-            return redirect(url_for("live",
-                                    js="off",
-                                    serial=form.serial.data))
-        else:
-            return redirect(url_for("live",
-                                    autoupdate=("off", "on")[form.autoupdate.data],
-                                    update_period=form.update_period.data,
-                                    serial=form.serial.data))
+            if form.js_off.data:
+                return redirect(url_for("live",
+                                        js="off",
+                                        serial=form.serial.data))
+            else:
+                return redirect(url_for("live",
+                                        autoupdate=("off", "on")[form.autoupdate.data],
+                                        update_period=form.update_period.data,
+                                        serial=form.serial.data))
 
-    return render_template("index.html", form=form)
+        return render_template("index.html", form=form)
 
 
 # Direct route to create a new life
@@ -80,13 +168,84 @@ def new_live(context, width=None, height=None):
         message = "Минимальный допустимый размер поля игры 1х1"
         return render_template("error.html", message=message, code=code), code
 
-    GameOfLife(context).create_new_random_life(width=width, height=height)
+    rule, error = get_rule()
+    if error is not None:
+        return error
+
+    with context:
+        GameOfLife(context).create_new_random_life(width=width, height=height, rule=rule or CONWAY)
 
-    args = dict((k, v) for k, v in request.args.items() if k not in ('width', 'height'))
+    args = dict((k, v) for k, v in request.args.items() if k not in ('width', 'height', 'rule'))
     return redirect(url_for("live", **args))
 
 
+# Import (POST) and export (GET) of the world as a pattern: RLE or plaintext
+@app.route("/pattern", methods=("GET", "POST"))
+@open_session
+def pattern(context):
+    if request.method == "POST":
+        return import_pattern(context)
+
+    pattern_format = request.args.get('format', 'rle')
+    if pattern_format not in PATTERN_FORMATS:
+        return invalid_parameter_message("format", f"Допустимые значения: {', '.join(PATTERN_FORMATS)}")
+
+    try:
+        serial = int(request.args.get('serial', '0'))
+    except ValueError:
+        return invalid_parameter_message("serial", "Значение должно быть целым числом")
+    if serial < 0:
+        return invalid_parameter_message("serial", "Значение должно быть больше или равно 0")
+
+    with context:
+        try:
+            text = GameOfLife(context).export_pattern(serial, pattern_format)
+        except NoGenerationError:
+            code = 500
+            message = "Нет ни одного поколения клеток. Пожалуйста создайте новую жизнь."
+            return render_template("error.html", message=message, code=code), code
+
+    response = Response(text, mimetype="text/plain")
+    response.headers['Content-Disposition'] = f'attachment; filename="life_{serial}.{pattern_format}"'
+    return response
+
+
+def import_pattern(context):
+    # The pattern is the uploaded file "pattern" or the body of the request
+    file = request.files.get('pattern')
+    text = file.read().decode('utf-8', 'replace') if file is not None else request.get_data(as_text=True)
+
+    size = {}
+    for name in ('width', 'height'):
+        if name in request.args:
+            try:
+                size[name] = int(request.args[name])
+            except ValueError:
+                return invalid_parameter_message(name, "Значение должно быть целым числом")
+            if not WORLD_MIN_SIZE <= size[name] <= WORLD_MAX_SIZE:
+                code = 400
+                message = f"Допустимые значения размеров поля игры от {WORLD_MIN_SIZE} до {WORLD_MAX_SIZE}"
+                return render_template("error.html", message=message, code=code), code
+
+    # the rule of the pattern, if it's not specified
+    rule, error = get_rule()
+    if error is not None:
+        return error
+
+    try:
+        with context:
+            GameOfLife(context).create_new_life_from_pattern(text, rule=rule, max_size=WORLD_MAX_SIZE, **size)
+    except PatternError as e:
+        code = 400
+        message = f"Не удалось прочитать шаблон: {e}"
+        return render_template("error.html", message=message, code=code), code
+
+    args = dict((k, v) for k, v in request.args.items() if k not in ('width', 'height', 'rule'))
+    return redirect(url_for("live", **args), code=303)
+
+
 @app.route("/live")
+@app.route("/world.png", endpoint="png_world", defaults={'view': 'png'})
 @app.route("/<view>")
 @open_session
 def live(context, view=None):
@@ -97,6 +256,7 @@ def live(context, view=None):
         code = 404
         message = f"Страница {request.url} не найдена"
         return render_template("error.html", message=message, code=code), code
+    g.view = view
 
     js = request.args.get('js')
     if js is not None and js.lower() in ("no", "off", "false", "0"):
@@ -104,28 +264,185 @@ def live(context, view=None):
     else:
         js = True
 
+    # The "plain_world" view can return a batch of `count` generations starting `from` the serial
+    serial_param = 'from' if view == "plain_world" and 'from' in request.args else 'serial'
     try:
-        serial = int(request.args.get('serial', '0'))
+        serial = int(request.args.get(serial_param, '0'))
     except ValueError:
-        return invalid_parameter_message("serial", "Значение должно быть целым числом")
+        return invalid_parameter_message(serial_param, "Значение должно быть целым числом")
     if serial < 0:
-        return invalid_parameter_message("serial", "Значение должно быть больше или равно 0")
+        return invalid_parameter_message(serial_param, "Значение должно быть больше или равно 0")
 
     try:
-        game = GameOfLife(context)
-        generation = game.get_generation(serial)
-    except NoGenerationError:
-        code = 500
-        message = "Нет ни одного поколения клеток. Пожалуйста создайте новую жизнь."
-        return render_template("error.html", message=message, code=code), code
+        count = int(request.args.get('count', '1'))
+    except ValueError:
+        return invalid_parameter_message("count", "Значение должно быть целым числом")
+    if not 1 <= count <= _MAX_FRAME_BATCH:
+        return invalid_parameter_message("count", f"Значение должно быть от 1 до {_MAX_FRAME_BATCH}")
+
+    # The serial of the generation that the client already has, to send the changes relative to it
+    base = request.args.get('base')
+    if base is not None:
+        try:
+            base = int(base)
+        except ValueError:
+            return invalid_parameter_message("base", "Значение должно быть целым числом")
+        if not 0 <= base < serial:
+            return invalid_parameter_message("base", f"Значение должно быть от 0 до {serial - 1}")
+
+    viewport, error = get_viewport()
+    if error is not None:
+        return error
+
+    try:
+        cell_size = int(request.args.get('cell_size', '1'))
+    except ValueError:
+        return invalid_parameter_message("cell_size", "Значение должно быть целым числом")
+    if not 1 <= cell_size <= _MAX_PNG_CELL_SIZE:
+        return invalid_parameter_message("cell_size", f"Значение должно быть от 1 до {_MAX_PNG_CELL_SIZE}")
+
+    wss = get_window_screen_size()
+
+    # The generations don't change, so we render them without holding the context
+    with context:
+        try:
+            game = GameOfLife(context)
+
+            # The response is determined by the first world of the game and the parameters, so we render it once.
+            # The URLs with the ID of the world (the "world" parameter) are immutable.
+            world_id = game.get_world_id()
+            if view == "plain_world":
+                key = (world_id, view, serial, count, base, plain_world_format(), sorted(viewport.items()))
+            elif view == "png":
+                key = (world_id, view, serial, cell_size, sorted(viewport.items()))
+            else:
+                key = (world_id, view, serial, js, wss, sorted(viewport.items()))
+            immutable = world_id is not None and request.args.get('world') == world_id
+
+            response = get_cached_response(key, immutable) if world_id is not None else None
+            if response is not None:
+                return response
+
+            if base is not None:
+                base = game.get_generation(base)
+            generation = game.get_generation(serial)
+            g.world_size, g.serial = f"{generation.width}x{generation.height}", generation.serial
+        except NoGenerationError:
+            code = 500
+            message = "Нет ни одного поколения клеток. Пожалуйста создайте новую жизнь."
+            return render_template("error.html", message=message, code=code), code
+
+        generations = [generation]
+        if view == "plain_world":
+            while len(generations) < count and not generation.is_over:
+                generation = game.get_generation(generation.serial + 1)
+                generations.append(generation)
+
+        # the game could be recreated while we waited for the generations
+        cacheable = game.get_world_id() == world_id
+
+    # Only the rectangle of the world is packed and sent (the whole world reduced to fit the page by default)
+    generations = [generation.get_window(**viewport) for generation in generations]
+    generation = generations[-1]
+    if base is not None:
+        base = base.get_window(**viewport)
 
     if view == "plain_world":
         # Here the use of "jinja" is not optimal. It will be long and difficult.
-        return render_plain_world(generation)
+        response = render_plain_worlds(generations, base)
+    elif view == "png":
+        response = render_png_world(generation, cell_size)
     else:
-        wss = get_window_screen_size()
         template = f"{view}.html"
-        return render_template(template, generation=generation, js=js, wss=wss)
+        response = render_world_page(template, generation=generation, js=js, wss=wss, world_id=world_id)
+
+    return cache_response(key, immutable, response) if cacheable else response
+
+
+@app.route("/world_stream")
+@open_session
+def world_stream(context):
+    # EventSource resumes the stream with the ID of the last received event
+    last_event_id = request.headers.get('Last-Event-ID')
+    try:
+        serial = int(last_event_id) + 1 if last_event_id else int(request.args.get('from', '0'))
+    except ValueError:
+        return invalid_parameter_message("from", "Значение должно быть целым числом")
+    if serial < 0:
+        return invalid_parameter_message("from", "Значение должно быть больше или равно 0")
+
+    # The serial of the generation that the client already has (the last received event), to send the changes relative
+    # to it
+    base = last_event_id or request.args.get('base')
+    if base is not None:
+        try:
+            base = int(base)
+        except ValueError:
+            return invalid_parameter_message("base", "Значение должно быть целым числом")
+        if not 0 <= base < serial:
+            return invalid_parameter_message("base", f"Значение должно быть от 0 до {serial - 1}")
+
+    try:
+        update_period = int(request.args.get('update_period', '1000'))
+    except ValueError:
+        return invalid_parameter_message("update_period", "Значение должно быть целым числом")
+    if update_period < _MIN_UPDATE_PERIOD:
+        return invalid_parameter_message("update_period", f"Значение должно быть не меньше {_MIN_UPDATE_PERIOD}")
+
+    viewport, error = get_viewport()
+    if error is not None:
+        return error
+
+    with context:
+        game = GameOfLife(context)
+        try:
+            if base is not None:
+                base = game.get_generation(base)
+            generation = game.get_generation(serial)
+            g.world_size, g.serial = f"{generation.width}x{generation.height}", generation.serial
+        except NoGenerationError:
+            code = 500
+            message = "Нет ни одного поколения клеток. Пожалуйста создайте новую жизнь."
+            return render_template("error.html", message=message, code=code), code
+
+    return render_world_stream(context, game, serial, update_period / 1000, viewport, base)
+
+
+def get_viewport():
+    """Returns the arguments of `CellGeneration.get_window` from the request and the error response (or None)"""
+
+    viewport = {}
+    for name, (argument, minimum) in _VIEWPORT_PARAMS.items():
+        value = request.args.get(name)
+        if value is None:
+            continue
+        try:
+            value = int(value)
+        except ValueError:
+            return None, invalid_parameter_message(name, "Значение должно быть целым числом")
+        if value < minimum:
+            return None, invalid_parameter_message(name, f"Значение должно быть больше или равно {minimum}")
+        viewport[argument] = value
+
+    return viewport, None
+
+
+# Metrics of this process in the Prometheus text format
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def get_rule():
+    """Returns the rule from the "rule" parameter of the request (None without it) and the error response (or None)"""
+
+    text = request.args.get('rule')
+    if text is None:
+        return None, None
+    try:
+        return parse_rule(text), None
+    except RuleError:
+        return None, invalid_parameter_message("rule", "Ожидаются правила в нотации B/S, например B3/S23 (без B0)")
 
 
 @app.route("/nothing_works")
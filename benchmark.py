@@ -0,0 +1,252 @@
+"""
+Benchmark of the world engines (`WorldFactory` of the `world` package).
+
+For each engine, world size and pattern it measures separately:
+    step    - `create_next_world`
+    pack    - `pack_two_worlds_into_array` (the frames sent to the browser)
+    unpack  - `world_from_bytes` (the history and the store)
+    cycle   - `world_to_bytes` and the search for a repeating world (`WorldDigests`)
+    render  - `CellGeneration.cell_state_rows` (world.html)
+
+The engines start from the same world, and their worlds and packed frames are compared after each step.
+
+    python benchmark.py                                  # all engines, the default cases
+    python benchmark.py --engines world64 active64 --sizes 100x100 1000x1000 --output baseline.json
+    python benchmark.py --compare baseline.json          # fails if an operation is slower than in the baseline
+    python benchmark.py --rule B36/S23                   # another Life-like rule (see `world.rules`)
+"""
+
+import argparse
+import importlib
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from game_of_life import CellGeneration, WorldDigests
+from world.canonical import bitarray_from_bytes, compact_bits
+from world.patterns import PatternError, parse_pattern, place_pattern
+from world.rules import Rule, parse_rule
+
+ENGINES = ('original', 'bitarray', 'world64', 'active64', 'vectorized')
+OPERATIONS = ('step', 'pack', 'unpack', 'cycle', 'render')
+
+# The widths are not multiples of 16 as well, to check the wrap of the packed engines (16 cells per record)
+DEFAULT_SIZES = ('64x64', '100x75', '256x256')
+DEFAULT_PATTERNS = ('random:0.5', 'random:0.1', 'gun', 'blocks')
+
+# The slow engines are measured only on the worlds up to this number of cells
+SLOW_ENGINES = ('original', 'bitarray')
+SLOW_ENGINE_MAX_CELLS = 128 * 128
+
+_GOSPER_GLIDER_GUN = """
+x = 36, y = 9, rule = B3/S23
+24bo$22bobo$12b2o6b2o12b2o$11bo3bo4b2o12b2o$2o8bo5bo3b2o$2o8bo3bob2o4b
+obo$10bo5bo7bo$11bo3bo$12b2o!
+"""
+
+
+def create_world_data(width: int, height: int, pattern: str, seed: int) -> bytes:
+    """
+    Returns the world in the canonical form:
+        random:D - random cells with the density D
+        gun      - Gosper glider gun in the center (a few active cells)
+        blocks   - a grid of blocks (still lifes, unless the width or the height isn't a multiple of 3: then the blocks
+                   touch across the wrap and the edge evolves)
+    """
+
+    name, _, parameter = pattern.partition(':')
+
+    if name == 'random':
+        rnd = random.Random(seed)
+        density = float(parameter or 0.5)
+        cells = bytes(rnd.random() < density for _ in range(width * height))
+    elif name == 'gun':
+        gun_width, gun_height, data, _ = parse_pattern(_GOSPER_GLIDER_GUN)
+        return place_pattern(gun_width, gun_height, data, width, height)
+    elif name == 'blocks':
+        block_row = (b'\x01\x01\x00' * width)[:width]
+        empty_row = bytes(width)
+        cells = b''.join((block_row, block_row, empty_row)[row % 3] for row in range(height))
+    else:
+        raise ValueError(f"Unknown pattern {pattern!r}")
+
+    return compact_bits(cells + bytes(-len(cells) % 8), 8)
+
+
+def load_engines(names) -> Dict[str, type]:
+    factories = {}
+    for name in names:
+        try:
+            factories[name] = importlib.import_module(f'world.{name}').WorldFactory
+        except ImportError as e:
+            # NumPy is optional
+            print(f"SKIP {name}: {e}", file=sys.stderr)
+    return factories
+
+
+def measure(factory, data: bytes, warmup: int, runs: int) -> Tuple[Dict[str, List[float]], List[bytes]]:
+    """
+    Returns the timings (seconds) of the operations and the outputs after each step: the world in the canonical form
+    and the packed frame (`CellGeneration.get_pack_world`)
+    """
+
+    timings = {operation: [] for operation in OPERATIONS}
+    outputs = []
+
+    world = factory.world_from_bytes(data)
+    digests = WorldDigests()
+    history = {0: data}
+
+    for serial in range(1, warmup + runs + 1):
+        t0 = time.perf_counter()
+        next_world = factory.create_next_world(world)
+        t1 = time.perf_counter()
+        packed = factory.pack_two_worlds_into_array(world, next_world)
+        t2 = time.perf_counter()
+        next_data = factory.world_to_bytes(next_world)
+        digests.find_repeat(serial, next_data, history.__getitem__)
+        t3 = time.perf_counter()
+        factory.world_from_bytes(next_data)
+        t4 = time.perf_counter()
+        CellGeneration(factory, serial, world, next_world).cell_state_rows()
+        t5 = time.perf_counter()
+
+        history[serial] = next_data
+        outputs.append(next_data)
+        outputs.append(array('I', packed).tobytes())  # the engines return the arrays of the different types
+        world = next_world
+
+        if serial > warmup:
+            for operation, elapsed in zip(OPERATIONS, (t1 - t0, t2 - t1, t3 - t2, t4 - t3, t5 - t4)):
+                timings[operation].append(elapsed)
+
+    return timings, outputs
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    p95 = statistics.quantiles(samples, n=20, method='inclusive')[-1] if len(samples) > 1 else samples[0]
+    return {'median': statistics.median(samples), 'p95': p95, 'runs': len(samples)}
+
+
+def run(engines: Dict[str, type], sizes: List[Tuple[int, int]], patterns: List[str], rule: Rule, warmup: int,
+        runs: int, seed: int) -> Tuple[List[dict], List[str]]:
+    """Returns the results and the errors (the engines that calculated different worlds)"""
+
+    results = []
+    errors = []
+
+    for width, height in sizes:
+        for pattern in patterns:
+            # the first engine that calculated the world
+            reference: Optional[Tuple[str, List[bytes]]] = None
+            try:
+                data = create_world_data(width, height, pattern, seed)
+            except PatternError as e:
+                # the gun doesn't fit the small worlds
+                print(f"SKIP {pattern} on {width}x{height}: {e}", file=sys.stderr)
+                continue
+
+            for name, factory_class in engines.items():
+                if name in SLOW_ENGINES and width * height > SLOW_ENGINE_MAX_CELLS:
+                    continue
+
+                factory = factory_class(width, height, rule)
+
+                # the world created from the bitarray is packed back as it was
+                array_ = bitarray_from_bytes(data)
+                if factory.pack_world_into_array(factory.create_world_from_array(array_)) != array_:
+                    errors.append(f"{name} creates (or packs) another world on {width}x{height} {pattern}")
+
+                timings, worlds = measure(factory, data, warmup, runs)
+
+                if reference is None:
+                    reference = name, worlds
+                reference_name, reference_worlds = reference
+                if worlds != reference_worlds:
+                    errors.append(f"{name} and {reference_name} differ on {width}x{height} {pattern}")
+
+                for operation in OPERATIONS:
+                    result = dict(engine=name, width=width, height=height, pattern=pattern, operation=operation)
+                    result.update(summarize(timings[operation]))
+                    results.append(result)
+                    print(f"{name:10} {width:>5}x{height:<5} {pattern:12} {operation:7}"
+                          f" median {result['median'] * 1000:9.3f} ms  p95 {result['p95'] * 1000:9.3f} ms")
+
+    return results, errors
+
+
+def compare(results: List[dict], baseline: List[dict], threshold: float) -> List[str]:
+    """Returns the regressions: the operations that are slower than in the baseline by more than the threshold"""
+
+    def key(result: dict) -> tuple:
+        return result['engine'], result['width'], result['height'], result['pattern'], result['operation']
+
+    baseline = dict((key(result), result) for result in baseline)
+    regressions = []
+
+    for result in results:
+        base = baseline.get(key(result))
+        if base is None:
+            continue
+
+        ratio = result['median'] / base['median'] if base['median'] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append(f"{' '.join(map(str, key(result)))}: {base['median'] * 1000:.3f} ms ->"
+                               f" {result['median'] * 1000:.3f} ms (x{ratio:.2f})")
+
+    return regressions
+
+
+def parse_size(size: str) -> Tuple[int, int]:
+    width, _, height = size.partition('x')
+    return int(width), int(height or width)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark of the world engines")
+    parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help="WIDTHxHEIGHT")
+    parser.add_argument('--patterns', nargs='+', default=DEFAULT_PATTERNS, help="random:DENSITY, gun or blocks")
+    parser.add_argument('--rule', type=parse_rule, default='B3/S23', help="B/S rulestring")
+    parser.add_argument('--warmup', type=int, default=3, help="steps before the measurements")
+    parser.add_argument('--runs', type=int, default=20, help="measured steps")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="save the results as JSON")
+    parser.add_argument('--compare', help="JSON of the baseline results")
+    parser.add_argument('--threshold', type=float, default=0.2, help="allowed slowdown relative to the baseline")
+    args = parser.parse_args()
+
+    engines = load_engines(args.engines)
+    sizes = [parse_size(size) for size in args.sizes]
+    results, errors = run(engines, sizes, args.patterns, args.rule, args.warmup, args.runs, args.seed)
+
+    if args.output:
+        meta = dict(python=platform.python_version(), platform=platform.platform(),
+                    time=time.strftime('%Y-%m-%dT%H:%M:%S'), args=dict(vars(args), rule=str(args.rule)))
+        with open(args.output, 'w') as file:
+            json.dump(dict(meta=meta, results=results), file, indent=1)
+
+    for error in errors:
+        print(f"FAIL: {error}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file)['results'], args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+
+    if errors or regressions:
+        return 1
+
+    print("SUCCESS")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,12 @@
-from wtforms import IntegerField, SubmitField, BooleanField, SelectField
-from wtforms.validators import InputRequired, NumberRange
+from wtforms import IntegerField, SubmitField, BooleanField, SelectField, StringField
+from wtforms.validators import InputRequired, NumberRange, ValidationError
 from flask_wtf import FlaskForm
 
 from util.session import SessionService, SessionContext
+from world.rules import CONWAY, KNOWN_RULES, RuleError, parse_rule
 
-_WORLD_MIN_SIZE = 1
-_WORLD_MAX_SIZE = 200
+WORLD_MIN_SIZE = 1
+WORLD_MAX_SIZE = 2000  # the large worlds are reduced to fit the page (see `CellGeneration.get_window`)
 _WORLD_DEFAULT_SIZE = 25
 
 
@@ -17,12 +18,16 @@ class WorldSizeForm(FlaskForm):
     width = IntegerField("Ширина мира",
                          default=lambda: _get_default_value('width', _WORLD_DEFAULT_SIZE),
                          validators=[InputRequired(),
-                                     NumberRange(_WORLD_MIN_SIZE, _WORLD_MAX_SIZE)])
+                                     NumberRange(WORLD_MIN_SIZE, WORLD_MAX_SIZE)])
 
     height = IntegerField("Высота мира",
                           default=lambda: _get_default_value('height', _WORLD_DEFAULT_SIZE),
                           validators=[InputRequired(),
-                                      NumberRange(_WORLD_MIN_SIZE, _WORLD_MAX_SIZE)])
+                                      NumberRange(WORLD_MIN_SIZE, WORLD_MAX_SIZE)])
+
+    rule = StringField("Правила",
+                       default=lambda: _get_default_value('rule', str(CONWAY)),
+                       validators=[InputRequired(), lambda form, field: _validate_rule(field)])
 
     serial = IntegerField("Перейти к поколению",
                           default=lambda: _get_default_value('serial', 0),
@@ -46,22 +51,33 @@ class WorldSizeForm(FlaskForm):
 
     @property
     def min_size(self):
-        return _WORLD_MIN_SIZE
+        return WORLD_MIN_SIZE
 
     @property
     def max_size(self):
-        return _WORLD_MAX_SIZE
+        return WORLD_MAX_SIZE
+
+    @property
+    def known_rules(self):
+        return KNOWN_RULES
 
     def validate_on_submit(self):
         result = super().validate_on_submit()
         if result:
             # TODO: How do get a list of form fields?
-            names = ("height", "width", "serial", "autoupdate", "update_period", "js_off")
+            names = ("height", "width", "rule", "serial", "autoupdate", "update_period", "js_off")
             for name in names:
                 self._context_data[name] = getattr(self, name).data
         return result
 
 
+def _validate_rule(field) -> None:
+    try:
+        parse_rule(field.data)
+    except RuleError:
+        raise ValidationError("Правила должны быть в нотации B/S, например B3/S23 (без B0)")
+
+
 def _get_default_value(name: str, default):
     # TODO: This is a workaround. I don't understand how to pass the session context data
     #  to the form fields in the initiator of the form object.
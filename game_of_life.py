@@ -1,8 +1,47 @@
+import os
+from bisect import insort
+from collections import OrderedDict
 from enum import IntEnum
-from typing import Optional, List
+from hashlib import blake2b
+from threading import Thread
+from typing import Optional, List, Dict, Callable, Tuple
 
-from util.session import SessionContext
+from util.metrics import Counter, Gauge, Histogram
+from util.session import SessionContext, SessionService
+from util.store import create_world_store
 from world import WorldFactory
+from world.canonical import array_from_bytes, downsample_bits, interleave_bits, spread_bits
+from world.hashlife import HashLife
+from world.history import WorldHistory
+from world.patterns import MAX_PATTERN_CELLS, PATTERN_FORMATS, PatternError, parse_pattern, place_pattern
+from world.rules import CONWAY, Rule, parse_rule
+from world.pool import create_next_world
+
+# Use HashLife to jump over at least so many generations to a distant generation (0 - never jump). A short jump over
+# a chaotic world is faster by stepping.
+_HASHLIFE_MIN_JUMP = int(os.environ.get('HASHLIFE_MIN_JUMP', 10000))
+_HASHLIFE_MAX_NODES = int(os.environ.get('HASHLIFE_MAX_NODES', 1 << 18))
+_HASHLIFE_NODE_SIZE = 500  # approximate size of a cached node in bytes
+
+# Calculate so many generations ahead of the requested one in a background thread (0 - calculate on request)
+_READ_AHEAD = int(os.environ.get('READ_AHEAD', 5))
+_READ_AHEAD_WAIT_TIMEOUT = 1.0  # seconds to wait for the background thread before checking it again
+_READ_AHEAD_IDLE_TIMEOUT = 10.0  # seconds without requests to stop the background thread
+
+# Keep every so many world as is, and the others as deltas from the previous world
+_HISTORY_KEYFRAME_INTERVAL = int(os.environ.get('HISTORY_KEYFRAME_INTERVAL', 64))
+
+# Approximate size of the history of a game in bytes
+_HISTORY_BUDGET = int(os.environ.get('HISTORY_BUDGET', 16 << 20))
+
+# Without the scale, a rectangle of the world is reduced to fit in this number of cells (see `CellGeneration.get_window`)
+_VIEW_MAX_SIZE = int(os.environ.get('VIEW_MAX_SIZE', 200))
+
+# The games shared by the worker processes (None - the games are kept only in the process memory)
+_WORLD_STORE = create_world_store()
+
+_STEP_SECONDS = Histogram('life_step_seconds', "Calculation of the next world: a step or a HashLife jump", ('kind',))
+_GENERATIONS = Counter('life_generations_total', "Calculated generations")
 
 
 class CellState(IntEnum):
@@ -12,48 +51,41 @@ class CellState(IntEnum):
     surviving = 3
 
 
-class CellGeneration:
+class WorldDigests:
+    """
+    Digests of the worlds of the game to find a repeating world (the end of the game). We keep a 128-bit digest
+    instead of the world itself, and compare the worlds only when the digests match.
+    """
 
-    def __init__(self, *,
-                 width: Optional[int] = None,
-                 height: Optional[int] = None,
-                 random: bool = False,
-                 previous: Optional['CellGeneration'] = None,
-                 ):
+    def __init__(self):
+        self._serials: Dict[bytes, int] = {}  # digest -> serial of the first world with this digest
+        self._collisions: Dict[bytes, int] = {}  # world -> serial, for worlds with someone else's digest
 
-        if previous is None:
-            self._serial = 0
+    def find_repeat(self, serial: int, data: bytes, get_data: Callable[[int], bytes]) -> Optional[int]:
+        """
+        Remember the world (as bytes) and returns the serial of the same earlier world or None.
+        `get_data` returns the earlier world (as bytes) by its serial.
+        """
 
-            if width is None:
-                raise AttributeError("Required `previous` or `width` and `height`")
-            elif width < 1:
-                raise ValueError(f"`width` must be natural number, got {width}")
+        digest = blake2b(data, digest_size=16).digest()
+        first_serial = self._serials.setdefault(digest, serial)
 
-            if height is None:
-                raise AttributeError("Required `previous` or `width` and `height`")
-            elif height < 1:
-                raise ValueError(f"`height` must be natural number, got {height}")
+        if first_serial == serial or get_data(first_serial) == data:
+            return None if first_serial == serial else first_serial
 
-            self._world_factory = WorldFactory(width, height)
+        # Different worlds with the same digest. It's unlikely to happen, so here we can afford to keep the worlds.
+        first_serial = self._collisions.setdefault(data, serial)
+        return None if first_serial == serial else first_serial
 
-            empty_world = tuple(self._world_factory.create_empty_world())
-            self._prev_world = empty_world  # Now the world was empty, and the Spirit of God hovered over it...
-            self._different_worlds = {empty_world}  # always includes an empty world
 
-            if random:
-                self._world = tuple(self._world_factory.create_random_world())
-            else:
-                self._world = empty_world
-        else:
-            self._previous = previous
-            self._serial = previous._serial + 1
-            self._world_factory = previous._world_factory
-            self._prev_world = previous._world
-            self._different_worlds = previous._different_worlds
-            self._world = tuple(self._world_factory.create_next_world(self._prev_world))
+class CellGeneration:
 
-        self._different_worlds.add(self._world)
-        self._is_over = self._serial >= len(self._different_worlds) - 1
+    def __init__(self, world_factory, serial: int, prev_world, world, repeated_serial: Optional[int] = None):
+        self._world_factory = world_factory
+        self._serial = serial
+        self._prev_world = prev_world
+        self._world = world
+        self._repeated_serial = repeated_serial  # serial of the earlier generation with the same world
 
     @property
     def serial(self) -> int:
@@ -69,15 +101,127 @@ class CellGeneration:
 
     @property
     def is_over(self):
-        return self._is_over
+        return self._repeated_serial is not None
+
+    @property
+    def cycle_start(self) -> Optional[int]:
+        """Serial of the first generation of the cycle in which the game ended, or None if the game is not over"""
+
+        if self._repeated_serial is None:
+            return None
+        elif self._repeated_serial < 0:
+            return self._serial  # all cells are dead (the same as the world before the first generation)
+        else:
+            return self._repeated_serial
+
+    @property
+    def period(self) -> Optional[int]:
+        """Period of the cycle in which the game ended, or None if the game is not over"""
+
+        if self._repeated_serial is None:
+            return None
+        return self._serial - self.cycle_start or 1
 
     def cell_state(self, row: int, col: int) -> CellState:
         s = self._world_factory
         return CellState(s.is_live_cell(self._world, row, col) + (s.is_live_cell(self._prev_world, row, col) << 1))
 
+    def cell_state_rows(self) -> List[bytes]:
+        """
+        The cell states (`CellState` values, a byte per cell) by rows. All cells are calculated at once from the worlds
+        in the canonical form, instead of `cell_state` for each of them.
+        """
+
+        width = self.width
+        size = width * self.height
+        data, prev_data = self._canonical_worlds()
+
+        cells = int.from_bytes(spread_bits(data, 8)[:size], 'little')
+        prev_cells = int.from_bytes(spread_bits(prev_data, 8)[:size], 'little')
+        states = (cells | prev_cells << 1).to_bytes(size, 'little')
+
+        return [states[start:start + width] for start in range(0, size, width)]
+
     def get_pack_world(self):
         return self._world_factory.pack_two_worlds_into_array(self._prev_world, self._world)
 
+    @property
+    def viewport(self) -> Optional[Dict[str, int]]:
+        """The rectangle of the world in this generation (see `get_window`), None - the whole world"""
+        return None
+
+    def get_window(self, x: int = 0, y: int = 0, width: Optional[int] = None, height: Optional[int] = None,
+                   scale: Optional[int] = None) -> 'CellGeneration':
+        """
+        Returns the generation of the rectangle of the world reduced `scale` times (see `CellWindow`). The rectangle is
+        clipped by the world. If the scale is not set, the rectangle is reduced to fit in `_VIEW_MAX_SIZE` cells.
+        """
+
+        world_width, world_height = self.width, self.height
+        x, y = min(x, world_width - 1), min(y, world_height - 1)
+        width = world_width - x if width is None else min(width, world_width - x)
+        height = world_height - y if height is None else min(height, world_height - y)
+        if scale is None:
+            scale = -(-max(width, height) // _VIEW_MAX_SIZE)
+
+        if (x, y, width, height, scale) == (0, 0, world_width, world_height, 1):
+            return self
+        return CellWindow(self, x, y, width, height, scale)
+
+    def _canonical_worlds(self) -> Tuple[bytes, bytes]:
+        """Returns the current and previous worlds in the canonical form"""
+
+        s = self._world_factory
+        return s.world_to_bytes(self._world), s.world_to_bytes(self._prev_world)
+
+
+class CellWindow(CellGeneration):
+    """
+    The generation of a rectangle of the world, reduced `scale` times: a cell is live if any cell of its
+    `scale` x `scale` square is live. Only the rectangle of the worlds is converted (see
+    `AbstractWorldFactory.window_to_bytes`), so the cost depends on the rectangle, not on the world.
+    """
+
+    def __init__(self, generation: CellGeneration, x: int, y: int, width: int, height: int, scale: int):
+        super().__init__(generation._world_factory, generation.serial, generation._prev_world, generation._world,
+                         generation._repeated_serial)
+
+        self._viewport = dict(x=x, y=y, w=width, h=height, scale=scale)
+        self._width = -(-width // scale)
+        self._height = -(-height // scale)
+
+        s = self._world_factory
+        self._data, self._prev_data = (
+            downsample_bits(s.window_to_bytes(world, x, y, width, height), width, height, scale)
+            for world in (self._world, self._prev_world))
+
+    @property
+    def width(self) -> int:
+        return self._width
+
+    @property
+    def height(self) -> int:
+        return self._height
+
+    @property
+    def viewport(self) -> Optional[Dict[str, int]]:
+        return self._viewport
+
+    def cell_state(self, row: int, col: int) -> CellState:
+        i = row * self._width + col
+        return CellState((self._data[i >> 3] >> (i & 7) & 1) + ((self._prev_data[i >> 3] >> (i & 7) & 1) << 1))
+
+    def get_pack_world(self):
+        data = interleave_bits(self._data, self._prev_data)
+        size = ((self._width * self._height + 15) >> 4) << 2
+        return array_from_bytes('I', data + bytes(size - len(data)))
+
+    def get_window(self, *args, **kwargs) -> CellGeneration:
+        raise GameOfLifeError("The window of a window is not supported")
+
+    def _canonical_worlds(self) -> Tuple[bytes, bytes]:
+        return self._data, self._prev_data
+
 
 class GameOfLifeError(Exception):
     pass
@@ -92,31 +236,423 @@ class GameOfLifeMeta(type):
     def __call__(cls, context: SessionContext):
         instance = context.data.get(cls)
         if instance is None:
-            context.data[cls] = instance = super(GameOfLifeMeta, cls).__call__()
+            context.data[cls] = instance = super(GameOfLifeMeta, cls).__call__(context)
+
+        # A request gets the game once, so we query the store once per request, not for each generation
+        if _WORLD_STORE is not None:
+            instance._sync_game()
+
         return instance
 
 
 class GameOfLife(metaclass=GameOfLifeMeta):
+    """
+    To get generations, you MUST hold the session context (see `SessionContext`). The new generations are calculated
+    in a background thread without holding the context, and `get_generation` releases the context while waiting for
+    them. So the requests for the calculated generations are not blocked by the calculation, and the requests for the
+    same new generation wait for one calculation. If read-ahead is enabled, the thread also calculates the next
+    generations after the requested one.
+    """
+
+    def __init__(self, context: SessionContext):
+        self._context = context
+        self._game_id: Optional[int] = None  # ID of the game in the `_WORLD_STORE`
+        self._world_id: Optional[str] = None
+        self._stored_over: Optional[Tuple[int, int]] = None  # (serial, repeated serial) of the game over in the store
+        self._world_factory = None
+        self._history: Optional[WorldHistory] = None
+        self._hashlife: Optional[HashLife] = None  # the cached nodes of the game speed up the next jumps
+
+        # Digests of the worlds to find the end of the game, starting from the serial of the first world. After a jump
+        # the search for repeating worlds starts again, so we keep a sorted list of (first serial, digests).
+        self._digests: List[Tuple[int, WorldDigests]] = []
+
+        self._repeats: Dict[int, int] = {}  # serial -> repeated serial, for the generations where the game is over
+
+        # Recently requested and read-ahead generations, to not restore them from the history
+        self._recent: OrderedDict[int, CellGeneration] = OrderedDict()
+
+        # The last calculated generation of the run that we continue, and the serial up to which we calculate it
+        self._frontier: Optional[CellGeneration] = None
+        self._target = 0
+        self._producer: Optional[Thread] = None
+        self._producer_error: Optional[Exception] = None  # why the background thread has failed
+
+    def create_new_random_life(self, width: int = 20, height: int = 20, rule: Rule = CONWAY) -> None:
+        if width < 1:
+            raise ValueError(f"`width` must be natural number, got {width}")
+        if height < 1:
+            raise ValueError(f"`height` must be natural number, got {height}")
+
+        factory = WorldFactory(width, height, rule)
+        self._create_life(width, height, factory, factory.create_random_world())
+
+    def create_new_life_from_pattern(self, pattern: str, width: Optional[int] = None, height: Optional[int] = None,
+                                     rule: Optional[Rule] = None, max_size: Optional[int] = None) -> None:
+        """
+        Create new life from the RLE or plaintext pattern (see `world.patterns`) in the center of the world. The world
+        is not smaller than the pattern. Without the rule, the rule of the pattern is used (Conway's Life by default).
+        Raises `PatternError` if the pattern can't be parsed or the world is larger than `max_size` x `max_size` (or
+        than `MAX_PATTERN_CELLS`).
+        """
+
+        pattern_width, pattern_height, data, pattern_rule = parse_pattern(pattern)
+        width = max(width or 0, pattern_width)
+        height = max(height or 0, pattern_height)
+        if max_size is not None and max(width, height) > max_size:
+            raise PatternError(f"The world {width}x{height} is larger than {max_size}x{max_size}")
+        if width * height > MAX_PATTERN_CELLS:
+            raise PatternError(f"The world {width}x{height} is larger than {MAX_PATTERN_CELLS} cells")
+
+        factory = WorldFactory(width, height, rule or pattern_rule or CONWAY)
+        data = place_pattern(pattern_width, pattern_height, data, factory.width, factory.height)
+        self._create_life(width, height, factory, factory.world_from_bytes(data))
+
+    def export_pattern(self, serial: int, pattern_format: str = 'rle') -> str:
+        """Returns the world of the generation as a pattern in the format (see `world.patterns.PATTERN_FORMATS`)"""
+
+        format_pattern = PATTERN_FORMATS[pattern_format]
+        generation = self.get_generation(serial)
+        factory = generation._world_factory
+        return format_pattern(factory.width, factory.height, factory.world_to_bytes(generation._world),
+                              f"Generation {generation.serial}", factory.rule)
+
+    def _create_life(self, width: int, height: int, factory, world) -> None:
+        game_id = None
+        if _WORLD_STORE is not None and self._context.key is not None:
+            game_id = _WORLD_STORE.create_game(self._context.key, width, height, str(factory.rule),
+                                               factory.world_to_bytes(world))
+
+        self._start_game(game_id, factory, world)
+
+    def _start_game(self, game_id: Optional[int], factory, world) -> None:
+        self._game_id = game_id
+        # the generations are determined by the size, the rule and the first world
+        header = f"{factory.width}x{factory.height}:{factory.rule}:".encode()
+        self._world_id = blake2b(header + factory.world_to_bytes(world), digest_size=16).hexdigest()
+        self._stored_over = None
+        self._world_factory = factory
+        self._history = WorldHistory(self._step_data, _HISTORY_KEYFRAME_INTERVAL, _HISTORY_BUDGET)
+        self._hashlife = (HashLife(factory.width, factory.height, _HASHLIFE_MAX_NODES, factory.rule)
+                          if _HASHLIFE_MIN_JUMP else None)
+        self._digests = []
+        self._repeats = {}
+        self._recent.clear()
+
+        # Now the world was empty, and the Spirit of God hovered over it...
+        empty_world = factory.create_empty_world()
+        self._start_digests(-1, empty_world)
+
+        generation = self._add_generation(0, empty_world, world, origin=True)
+        self._frontier = self._remember(generation)
+        self._target = 0
+
+    def _sync_game(self) -> None:
+        """
+        Catch up with the game in the store: it could be recreated, or be over, in another process. It is called when
+        a request gets the game (see `GameOfLifeMeta`).
+        """
+
+        game = _WORLD_STORE.get_game(self._context.key)
+        if game is None:
+            # the game has expired in the store, now it's only ours
+            self._game_id = None
+            return
+
+        game_id, width, height, rule = game
+        if game_id != self._game_id:
+            factory = WorldFactory(width, height, parse_rule(rule))
+            _, data = _WORLD_STORE.find_world(game_id, 0)
+            self._start_game(game_id, factory, factory.world_from_bytes(data))
+
+        over = _WORLD_STORE.get_game_over(game_id)
+        if over is not None and over != self._stored_over:
+            self._stored_over = over
+            serial, repeated_serial = over
+            self._repeats.setdefault(serial, repeated_serial)
+
+            # forget the generations after the end of the game
+            for recent_serial in [recent_serial for recent_serial in self._recent if recent_serial >= serial]:
+                del self._recent[recent_serial]
+            if self._frontier.serial >= serial:
+                self._frontier = self._remember(self._restore_generation(serial))
+
+    def get_world_id(self) -> Optional[str]:
+        """
+        ID of the first world of the game (None if there is no game). The generations are determined by the first world
+        and the rule, so the generations of the games with the same ID are the same (in any session and process).
+        """
+
+        return self._world_id
 
-    def __init__(self):
-        self._generations: Optional[List[CellGeneration]] = None
+    @property
+    def history_size(self) -> int:
+        """Approximate size of the stored history in bytes"""
+        return 0 if self._history is None else self._history.size
 
-    def create_new_random_life(self, width: int = 20, height: int = 20) -> None:
-        self._generations = [CellGeneration(width=width, height=height, random=True)]
+    @property
+    def history_count(self) -> int:
+        """Number of the stored generations"""
+        return 0 if self._history is None else self._history.count
+
+    @property
+    def size(self) -> int:
+        """Approximate size of the game in bytes (see `SessionContext.size`)"""
+        hashlife_size = 0 if self._hashlife is None else self._hashlife.cache_size * _HASHLIFE_NODE_SIZE
+        return self.history_size + hashlife_size
 
     def get_generation(self, serial: int) -> CellGeneration:
         if serial < 0:
             raise ValueError(f"`serial` must be positive number, got {serial}")
 
-        if self._generations is None:
+        if self._history is None:
             raise NoGenerationError("First need to call the `create_new_life` function")
 
-        if serial < len(self._generations):
-            return self._generations[serial]
+        end = self._end_serial()
+        if end is not None:
+            serial = min(serial, end)
+
+        generation = self._recent.get(serial)
+        if generation is None:
+            first, last = self._history.find_run(serial)
+            if serial <= last:
+                generation = self._restore_generation(serial)
+            else:
+                generation = self._calculate_generation(serial, last)
+            self._remember(generation)
+
+        if _READ_AHEAD:
+            self._read_ahead(generation.serial + _READ_AHEAD)
 
-        generation = self._generations[-1]
-        while generation.serial < serial and not generation.is_over:
-            generation = CellGeneration(previous=generation)
-            self._generations.append(generation)
+        return generation
 
+    def _calculate_generation(self, serial: int, last: int) -> CellGeneration:
+        # continue from the nearest calculated generation before the requested one
+        generation = self._frontier
+        if generation.serial != last:
+            generation = self._restore_generation(last)
+
+        # don't jump over the stored worlds
+        target = serial
+        next_first, _ = self._history.find_run(serial + 1)
+        if next_first > generation.serial:
+            target = next_first - 1
+
+        # continue from a world calculated by another process
+        if self._game_id is not None and target - generation.serial >= 2:
+            stored = _WORLD_STORE.find_world(self._game_id, target - 1)
+            if stored is not None and stored[0] > generation.serial:
+                generation = self._start_generation(stored[0], self._world_factory.world_from_bytes(stored[1]))
+
+        if self._frontier.serial != generation.serial and self._is_producing():
+            # Another request is waiting for the frontier. We'll take it over when it's done.
+            return self._wait_for_generation(serial)
+
+        self._frontier = generation
+        self._target = serial
+        return self._wait_for_generation(serial)
+
+    def _wait_for_generation(self, serial: int) -> CellGeneration:
+        """Wait until the read-ahead thread calculates the generation (or the game is over)"""
+
+        while True:
+            generation = self._recent.get(serial)
+            if generation is not None:
+                return generation
+
+            first, last = self._history.find_run(serial)
+            if serial <= last:
+                return self._restore_generation(serial)
+            elif last in self._repeats:
+                return self._restore_generation(last)
+
+            if self._frontier.serial == last:
+                self._read_ahead(serial)
+            elif not self._is_producing():
+                # Another request has moved the frontier to another run, and it's done
+                self._frontier = self._restore_generation(last)
+                self._target = serial
+                self._read_ahead(serial)
+
+            self._context.wait(_READ_AHEAD_WAIT_TIMEOUT)
+            if self._producer_error is not None:
+                # the calculation has failed, the next request will try again
+                raise self._producer_error
+
+    def _is_producing(self) -> bool:
+        """Whether the background thread has to calculate the frontier run further"""
+        return self._frontier.serial < self._target and not self._frontier.is_over
+
+    def _read_ahead(self, target: int) -> None:
+        """Calculate the generations of the frontier run up to the target serial in the background"""
+
+        self._target = max(self._target, target)
+        if self._is_producing():
+            if self._producer is None or not self._producer.is_alive():
+                self._producer_error = None
+                self._producer = Thread(target=self._produce, daemon=True)
+                self._producer.start()
+            else:
+                self._context.notify_all()
+
+    def _produce(self) -> None:
+        try:
+            self._produce_generations()
+        except Exception as e:
+            # the requests waiting for the generations raise the error instead of waiting forever
+            with self._context:
+                self._producer = None
+                self._producer_error = e
+                self._context.notify_all()
+
+    def _produce_generations(self) -> None:
+        context = self._context
+
+        while True:
+            with context:
+                idle = False
+                generation = self._frontier
+                while generation.is_over or generation.serial >= self._target:
+                    if idle:
+                        # nobody polls the game
+                        self._producer = None
+                        return
+                    idle = not context.wait(_READ_AHEAD_IDLE_TIMEOUT)
+                    generation = self._frontier
+
+                if generation.serial + 1 in self._history:
+                    self._frontier = self._remember(self._next_generation(generation))
+                    context.notify_all()
+                    continue
+
+                # don't jump over the stored worlds
+                target = self._target
+                next_first, _ = self._history.find_run(target + 1)
+                if next_first > generation.serial:
+                    target = min(target, next_first - 1)
+
+                # don't jump over the known end of the game (see `_jump`)
+                hashlife = self._hashlife
+                end = self._end_serial()
+                jump = (hashlife is not None and (end is None or target <= end) and
+                        target - generation.serial >= max(_HASHLIFE_MIN_JUMP, 2))
+
+            # Calculate the next world without holding the context, so requests for the calculated generations don't
+            # wait for us
+            factory = generation._world_factory
+            if jump:
+                with _STEP_SECONDS.labels('jump').time():
+                    world = self._jump(hashlife, generation, target)
+                with _STEP_SECONDS.labels('step').time():
+                    next_world = create_next_world(factory, world)
+            else:
+                with _STEP_SECONDS.labels('step').time():
+                    world = create_next_world(factory, generation._world)
+
+            with context:
+                # the frontier could be moved by a request (or the game could be recreated) in the meantime
+                if self._frontier is generation:
+                    if jump:
+                        self._frontier = self._remember(self._start_generation(target - 1, world, next_world))
+                    else:
+                        self._frontier = self._remember(self._next_generation(generation, world))
+                    context.notify_all()
+
+    def _end_serial(self) -> Optional[int]:
+        """The serial of the generation where the game is over, if it's known"""
+        return min(self._repeats, default=None)
+
+    def _remember(self, generation: CellGeneration) -> CellGeneration:
+        self._recent[generation.serial] = generation
+        self._recent.move_to_end(generation.serial)
+        while len(self._recent) > _READ_AHEAD + 2:
+            self._recent.popitem(last=False)
         return generation
+
+    def _next_generation(self, generation: CellGeneration, world=None) -> CellGeneration:
+        serial = generation.serial + 1
+        if serial in self._history:
+            # we have reached the stored worlds (after a jump)
+            return self._restore_generation(serial, generation._world)
+
+        if world is None:
+            world = create_next_world(self._world_factory, generation._world)
+        return self._add_generation(serial, generation._world, world)
+
+    def _step_data(self, data: bytes) -> bytes:
+        factory = self._world_factory
+        with _STEP_SECONDS.labels('history').time():
+            return factory.world_to_bytes(create_next_world(factory, factory.world_from_bytes(data)))
+
+    def _start_digests(self, serial: int, world) -> None:
+        data = self._world_factory.world_to_bytes(world)
+        self._history.add(serial, data)
+
+        digests = WorldDigests()
+        digests.find_repeat(serial, data, self._history.get)
+        insort(self._digests, (serial, digests), key=lambda item: item[0])
+
+    def _add_generation(self, serial: int, prev_world, world, origin: bool = False) -> CellGeneration:
+        data = self._world_factory.world_to_bytes(world)
+        self._history.add(serial, data, origin)
+
+        digests = next(digests for first, digests in reversed(self._digests) if first < serial)
+        repeated_serial = digests.find_repeat(serial, data, self._history.get)
+
+        if serial in self._repeats:
+            # the end found earlier: by another process, or before a jump (see `_jump`)
+            repeated_serial = self._repeats[serial]
+
+        if repeated_serial is not None:
+            self._repeats[serial] = repeated_serial
+
+        _GENERATIONS.inc()
+
+        if self._game_id is not None:
+            if repeated_serial is not None:
+                _WORLD_STORE.set_game_over(self._game_id, serial, repeated_serial)
+            elif serial > 0 and serial % _HISTORY_KEYFRAME_INTERVAL == 0:
+                _WORLD_STORE.add_world(self._game_id, serial, data)
+
+        return CellGeneration(self._world_factory, serial, prev_world, world, repeated_serial)
+
+    def _restore_generation(self, serial: int, prev_world=None) -> CellGeneration:
+        factory = self._world_factory
+        if prev_world is None:
+            prev_world = factory.world_from_bytes(self._history.get(serial - 1))
+        world = factory.world_from_bytes(self._history.get(serial))
+        return CellGeneration(factory, serial, prev_world, world, self._repeats.get(serial))
+
+    @staticmethod
+    def _jump(hashlife: HashLife, generation: CellGeneration, serial: int):
+        """
+        Returns the previous world of the requested generation, jumping over the intermediate generations (doesn't
+        need the context). The search for repeating worlds starts again from this world (see `_start_generation`), so
+        the game is over on the jumped run when its world repeats. A cycle that started before the jump is found within
+        a period after it, and if the skipped generations are calculated later, the earlier end is taken (see
+        `_end_serial`).
+        """
+
+        factory = generation._world_factory
+        data = hashlife.advance(factory.world_to_bytes(generation._world), serial - 1 - generation.serial)
+        return factory.world_from_bytes(data)
+
+    def _start_generation(self, serial: int, world, next_world=None) -> CellGeneration:
+        """Start a new run of generations from the world, returns the next generation after it"""
+
+        if next_world is None:
+            next_world = create_next_world(self._world_factory, world)
+
+        self._start_digests(serial, world)
+        return self._add_generation(serial + 1, world, next_world)
+
+
+def _games() -> List[GameOfLife]:
+    """The games of the sessions of this process"""
+    return [game for game in (context.get(GameOfLife) for context in SessionService().contexts) if game is not None]
+
+
+Gauge('life_history_generations', "Generations stored in the histories of the games",
+      lambda: sum(game.history_count for game in _games()))
+Gauge('life_history_bytes', "Approximate size of the histories of the games in bytes",
+      lambda: sum(game.history_size for game in _games()))
@@ -1,13 +1,26 @@
+import sys
+import time
+from array import array
+from base64 import b64encode
 from functools import wraps
+from hashlib import blake2b
+from struct import Struct
+from typing import Optional, Tuple
 
-from flask import request, url_for, redirect, render_template, Response
+from flask import request, url_for, redirect, render_template, make_response, Response, stream_with_context
 
+from util.cache import ResponseCache
+from util.metrics import CallbackCounter, Gauge, Histogram
+from util.png import encode_palette_png
 from util.session import SessionService
+from world.history import encode_delta
 
 
 def open_session(f):
     """
-    Decorator to create session and giving the session context to wrapped function.
+    Decorator to create session and giving the session context to wrapped function. The context is not held, so the
+    wrapped function holds it (`with context:`) only while it works with the session data, and, for example, renders
+    the response without blocking the other requests of the session.
 
     http://flask.pocoo.org/docs/0.12/patterns/viewdecorators/
     """
@@ -16,8 +29,7 @@ def open_session(f):
     def decorated_function(*args, **kwargs):
         session_service = SessionService()
         if session_service.has_session():
-            with session_service.get_session_context() as context:
-                return f(context, *args, **kwargs)
+            return f(session_service.get_session_context(), *args, **kwargs)
         else:
             session_service.create_session()
             return redirect(url_for("check_session", next=request.url))
@@ -25,6 +37,52 @@ def open_session(f):
     return decorated_function
 
 
+def get_cached_response(key: tuple, immutable: bool) -> Optional[Response]:
+    """
+    Returns `304 Not Modified` if the client has the response for the key, the response from the cache, or None if it
+    has to be rendered (then pass it to `cache_response`). The key (the world ID, the serial, the format...) MUST
+    determine the content of the response. `immutable` - the URL includes the world ID.
+    """
+
+    etag = _response_etag(key)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        entry = _RESPONSE_CACHE.get(etag)
+        if entry is None:
+            return None
+        body, headers = entry
+        response = Response(body, headers=headers)
+
+    return _set_cache_headers(response, etag, immutable)
+
+
+def cache_response(key: tuple, immutable: bool, response: Response) -> Response:
+    """Put the rendered response for the key into the cache (see `get_cached_response`)"""
+
+    etag = _response_etag(key)
+    if response.status_code == 200:
+        headers = [(name, value) for name, value in response.headers if name != 'Content-Length']
+        _RESPONSE_CACHE.put(etag, response.get_data(), headers)
+
+    return _set_cache_headers(response, etag, immutable)
+
+
+def _response_etag(key: tuple) -> str:
+    return blake2b(repr(key).encode(), digest_size=16).hexdigest()
+
+
+def _set_cache_headers(response: Response, etag: str, immutable: bool) -> Response:
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = _IMMUTABLE_CACHE_CONTROL if immutable else _REVALIDATE_CACHE_CONTROL
+    return response
+
+
+def plain_world_format() -> str:
+    """The format of the "plain_world" view accepted by the client (see `render_plain_worlds`)"""
+    return request.accept_mimetypes.best_match(("text/plain", "application/octet-stream")) or "text/plain"
+
+
 def get_window_screen_size():
     try:
         return tuple(map(int, request.cookies.get("wss").split('x')))
@@ -38,11 +96,188 @@ def invalid_parameter_message(param_name: str, err_message: str):
     return render_template("error.html", message=message, code=code), code
 
 
+# The rendered frames shared by the sessions (see `get_cached_response`)
+_RESPONSE_CACHE = ResponseCache()
+
+Gauge('life_response_cache_bytes', "Approximate size of the cached responses in bytes", lambda: _RESPONSE_CACHE.size)
+CallbackCounter('life_response_cache_hits_total', "Responses found in the cache", lambda: _RESPONSE_CACHE.hit_count)
+CallbackCounter('life_response_cache_misses_total', "Responses not found in the cache",
+                lambda: _RESPONSE_CACHE.miss_count)
+
+_RENDER_SECONDS = Histogram('life_render_seconds', "Rendering of the generations by the format", ('format',))
+_PACK_SECONDS = Histogram('life_pack_seconds', "Packing of the cell states of a generation (`get_pack_world`)")
+
+# The responses which URL includes the world ID never change
+_IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# The other responses depend on the game of the session, so the browser has to revalidate them (by the ETag)
+_REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+# The colors of the cell states (see `game_of_life.CellState`) in the PNG images, the same as in styles.css
+_CELL_COLORS = (
+    (0xF5, 0xF5, 0xF5),  # empty - whitesmoke
+    (0x90, 0xEE, 0x90),  # living - lightgreen
+    (0x8B, 0x00, 0x00),  # dead - darkred
+    (0x00, 0x80, 0x00),  # surviving - green
+)
+
+# Header of the binary world: serial, flags, width and height (little-endian uint32)
+_BINARY_WORLD_HEADER = Struct('<IIII')
+_GAME_OVER_FLAG = 1
+_DELTA_FLAG = 2
+
+# Length of the delta that follows the header of a delta frame
+_BINARY_DELTA_LENGTH = Struct('<I')
+
+# Offsets and lengths of the delta records are multiples of uint32
+_RECORD_SIZE = 4
+
+
 def render_plain_world(generation):
-    response = Response("\n".join((
+    return render_plain_worlds([generation])
+
+
+def render_plain_worlds(generations, base=None):
+    """
+    Render the generations as text: for each generation its serial, "GAME OVER" or an empty line, and the packed
+    cell states (one uint32 per line). The generations are separated by an empty line. If the client accepts
+    `application/octet-stream`, render them in binary (see `render_binary_worlds`).
+    """
+
+    if plain_world_format() == "application/octet-stream":
+        response = render_binary_worlds(generations, base)
+    else:
+        with _RENDER_SECONDS.labels('text').time():
+            response = Response("\n\n".join(map(_plain_world_text, generations)))
+
+        response.headers['Content-Type'] = "text/plain; charset=utf-8"
+
+    response.headers['Vary'] = "Accept"
+    return response
+
+
+def _plain_world_text(generation) -> str:
+    return "\n".join((
         str(generation.serial),
         "GAME OVER" if generation.is_over else "",
-        *map(str, generation.get_pack_world()))))
+        *map(str, _pack_world(generation))))
+
 
-    response.headers['Content-Type'] = "text/plain; charset=utf-8"
+def render_world_stream(context, game, serial: int, update_period: float, viewport: dict, base=None):
+    """
+    Render the generations starting from the serial as Server-Sent Events, one generation per `update_period`
+    seconds. The event ID is the serial of the generation, and the data is the binary frame of `render_binary_worlds`
+    of the rectangle of the world (`viewport` are the arguments of `CellGeneration.get_window`) in base64. A frame is
+    a delta frame relative to the previous event (or the `base` generation that the client has) when it's smaller.
+
+    The session context is held only while getting a generation. If the client falls behind (the sending blocks), the
+    next generations are not sent ahead of time, but one period after the previous one.
+    """
+
+    def generate(serial, base):
+        prev_data = None if base is None else _pack_world_into_bytes(base.get_window(**viewport))
+
+        next_time = time.monotonic()
+        while True:
+            with context:
+                generation = game.get_generation(serial)
+
+            with _RENDER_SECONDS.labels('stream').time():
+                frame, prev_data = _binary_world_frame(generation.get_window(**viewport), prev_data)
+
+            yield f"id: {generation.serial}\ndata: {b64encode(frame).decode()}\n\n"
+
+            if generation.is_over:
+                return
+            serial = generation.serial + 1
+
+            next_time = max(next_time + update_period, time.monotonic())
+            time.sleep(max(next_time - time.monotonic(), 0))
+
+    response = Response(stream_with_context(generate(serial, base)), mimetype="text/event-stream")
+    response.headers['Cache-Control'] = "no-cache"
+    response.headers['X-Accel-Buffering'] = "no"  # don't let a proxy (nginx) buffer the events
+    return response
+
+
+def render_binary_worlds(generations, base=None):
+    """
+    Render the generations in binary: for each generation the header (see `_BINARY_WORLD_HEADER`) and the packed
+    cell states as little-endian uint32 (2 bit per cell, `ceil(width * height / 16)` records).
+
+    If the client has the `base` generation, a generation can be sent as a delta frame (flag `_DELTA_FLAG`): the
+    header, the length of the delta and the XOR of the packed cell states with the previous frame (the base for the
+    first frame), run-length encoded (see `world.history.encode_delta`). We do it when the delta is smaller.
+    """
+
+    with _RENDER_SECONDS.labels('binary').time():
+        prev_data = None if base is None else _pack_world_into_bytes(base)
+
+        frames = []
+        for generation in generations:
+            frame, prev_data = _binary_world_frame(generation, prev_data)
+            frames.append(frame)
+
+    response = Response(b"".join(frames))
+    response.headers['Content-Type'] = "application/octet-stream"
     return response
+
+
+def _binary_world_frame(generation, prev_data: Optional[bytes]) -> Tuple[bytes, bytes]:
+    """Returns the binary frame of the generation (see `render_binary_worlds`) and its packed cell states"""
+
+    data = _pack_world_into_bytes(generation)
+
+    flags = _GAME_OVER_FLAG if generation.is_over else 0
+    body = data
+    if prev_data is not None and len(prev_data) == len(data):
+        delta = encode_delta(prev_data, data, _RECORD_SIZE)
+        if _BINARY_DELTA_LENGTH.size + len(delta) < len(data):
+            flags |= _DELTA_FLAG
+            body = _BINARY_DELTA_LENGTH.pack(len(delta)) + delta
+
+    header = _BINARY_WORLD_HEADER.pack(generation.serial, flags, generation.width, generation.height)
+    return header + body, data
+
+
+def render_png_world(generation, cell_size: int):
+    """Render the generation as a PNG image with a palette of the cell states, `cell_size` x `cell_size` pixels a cell"""
+
+    def generate_rows():
+        for states in generation.cell_state_rows():
+            if cell_size > 1:
+                pixels = bytearray(len(states) * cell_size)
+                for offset in range(cell_size):
+                    pixels[offset::cell_size] = states
+                states = bytes(pixels)
+
+            for _ in range(cell_size):
+                yield states
+
+    with _RENDER_SECONDS.labels('png').time():
+        data = encode_palette_png(generation.width * cell_size, generation.height * cell_size, generate_rows(),
+                                  _CELL_COLORS)
+    return Response(data, mimetype="image/png")
+
+
+def render_world_page(template: str, **context):
+    """Render the HTML page of the generation"""
+
+    with _RENDER_SECONDS.labels('html').time():
+        return make_response(render_template(template, **context))
+
+
+def _pack_world_into_bytes(generation) -> bytes:
+    """The packed cell states as little-endian uint32"""
+
+    records = _pack_world(generation)
+    if records.itemsize != _RECORD_SIZE or sys.byteorder != 'little':
+        records = array('I', records)
+        if sys.byteorder != 'little':
+            records.byteswap()
+    return records.tobytes()
+
+
+def _pack_world(generation):
+    with _PACK_SECONDS.time():
+        return generation.get_pack_world()
@@ -9,8 +9,14 @@
     const AUTO_UPDATE_PARAM = "autoupdate"
     const UPDATE_PERIOD_PARAM = "update_period";
     const WORLD_SERIAL_PARAM = "serial";
+    const WORLD_ID_PARAM = "world";
 
     const WORLD_URL = '/plain_world';
+    const STREAM_URL = '/world_stream';
+    const BINARY_WORLD_TYPE = 'application/octet-stream';
+    const BINARY_WORLD_HEADER_SIZE = 16; // serial, flags, width, height (little-endian uint32)
+    const GAME_OVER_FLAG = 1;
+    const DELTA_FLAG = 2;
 
     const GAME_OVER_SECTOR = '#gameOver';
     const CONTENT_SECTOR = '.app_content';
@@ -22,22 +28,28 @@
     // const CELL_COLOR = ['whitesmoke', 'lightgreen', 'darkred', 'green'];
 
     const worldContainer = getElementById('worldContainer', true);
+    const worldId = worldContainer.dataset.worldId; // the frames of the world never change (see app.live)
+    const viewport = new URLSearchParams(worldContainer.dataset.viewport); // the rectangle of the world on the page
     const wordHeader = getElementById("worldHeader");
     const worldTable = getElementById("worldTable", true);
     const counter = getElementById('counter');
     const refreshButton = getElementById('refreshButton');
     const exitButton = getElementById('exitButton');
 
-    const FRAME_QUEUE_SIZE = 5;
+    const FRAME_QUEUE_SIZE = 10;
+    const FRAME_BATCH_SIZE = 5; // generations per request
     const FRAME_QUEUE_TIMEOUT = 10;
     const frameQueue = [];
     let latestLoadedWorld = parseInt(counter?.textContent);
+    let latestLoadedCellStates;
     let latestShownWorld = latestLoadedWorld;
 
     let autoUpdateEnabled;
     let updatePeriod;
     let currentUpdateLoopId = 0;
     let latestCellStates;
+    let cells;
+    let streamDisabled = window.EventSource === undefined;
 
     init();
 
@@ -164,18 +176,29 @@
     }
 
     async function loadWorldLoop(loopId) {
+        if (!streamDisabled) {
+            await streamWorldLoop(loopId);
+            if (!streamDisabled) {
+                return;
+            }
+        }
+
         while (loopId === currentUpdateLoopId) {
 
-            if (frameQueue.length >= FRAME_QUEUE_SIZE) {
+            if (frameQueue.length + FRAME_BATCH_SIZE > FRAME_QUEUE_SIZE) {
                 await sleep(updatePeriod);
                 continue;
             }
 
-            const frame = createFrame(await loadWorld(latestLoadedWorld + 1));
-            frameQueue.push(frame);
+            const base = latestLoadedCellStates === undefined ? NaN : latestLoadedWorld;
+            const frames = createFrames(latestLoadedCellStates,
+                ...await loadWorlds(latestLoadedWorld + 1, FRAME_BATCH_SIZE, base));
+            frameQueue.push(...frames);
 
+            const frame = frames[frames.length - 1];
             if (!isNaN(frame.serial)) {
                 latestLoadedWorld = frame.serial;
+                latestLoadedCellStates = frame.cellStates;
             }
 
             if (frame.eof) {
@@ -184,24 +207,108 @@
         }
     }
 
-    async function loadWorld(serial) {
+    async function streamWorldLoop(loopId) {
+        while (loopId === currentUpdateLoopId) {
+
+            if (frameQueue.length + FRAME_BATCH_SIZE > FRAME_QUEUE_SIZE) {
+                await sleep(updatePeriod);
+                continue;
+            }
+
+            const result = await streamWorlds(loopId);
+            if (result === 'eof') {
+                break;
+            } else if (result === 'failed') {
+                // the stream is not available, load the worlds by requests
+                console.warn('Failed to open the stream of worlds');
+                streamDisabled = true;
+                break;
+            }
+        }
+    }
+
+    function streamWorlds(loopId) {
+        // The server sends the worlds one per period. We close the stream, when the loops are stopped or the queue is
+        // full, and open it again, when the queue has room. If the connection is lost, EventSource resumes the stream
+        // from the last received world (see app.world_stream). The events are binary frames in base64, and the delta
+        // frames are relative to the previous event (to the `base` world for the first one).
+        const url = new URL(STREAM_URL, location);
+        if (!isNaN(latestLoadedWorld)) {
+            url.searchParams.set('from', latestLoadedWorld + 1);
+            if (latestLoadedCellStates !== undefined) {
+                url.searchParams.set('base', latestLoadedWorld);
+            }
+        }
+        url.searchParams.set(UPDATE_PERIOD_PARAM, updatePeriod);
+        viewport.forEach((value, name) => url.searchParams.set(name, value));
+
+        const source = new EventSource(url);
+        let received = false;
+
+        return new Promise(resolve => {
+            const close = (result) => {
+                source.close();
+                resolve(result);
+            };
+
+            source.onmessage = (event) => {
+                received = true;
+                if (loopId !== currentUpdateLoopId) {
+                    close('stopped');
+                    return;
+                }
+
+                const data = Uint8Array.from(atob(event.data), c => c.charCodeAt(0)).buffer;
+                const [frame] = createFrames(latestLoadedCellStates, true, data);
+                frameQueue.push(frame);
+                latestLoadedWorld = frame.serial;
+                latestLoadedCellStates = frame.cellStates;
+
+                if (frame.eof) {
+                    close('eof');
+                } else if (frameQueue.length >= FRAME_QUEUE_SIZE) {
+                    close('full');
+                }
+            };
+
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    close(received ? 'closed' : 'failed');
+                }
+            };
+        });
+    }
+
+    async function loadWorlds(serial, count, base) {
         let success;
-        let html_text;
+        let data;
 
         try {
             const url = new URL(WORLD_URL, location);
             if (!isNaN(serial)) {
-                url.searchParams.set('serial', serial)
+                url.searchParams.set('from', serial)
+            }
+            url.searchParams.set('count', count);
+            if (!isNaN(base)) {
+                url.searchParams.set('base', base);
             }
-            const response = await fetch(url);
+            if (worldId) {
+                url.searchParams.set(WORLD_ID_PARAM, worldId);
+            }
+            viewport.forEach((value, name) => url.searchParams.set(name, value));
+            const response = await fetch(url, {headers: {'Accept': BINARY_WORLD_TYPE}});
             success = response.ok;
-            html_text = await response.text();
+            if (success && response.headers.get('Content-Type') === BINARY_WORLD_TYPE) {
+                data = await response.arrayBuffer();
+            } else {
+                data = await response.text();
+            }
         } catch (e) {
-            html_text = html_error_message('Ошибка сети', `Я не могу получить ${serial} поколение жизни: ${e.message}`);
+            data = html_error_message('Ошибка сети', `Я не могу получить ${serial} поколение жизни: ${e.message}`);
             success = false;
         }
 
-        return [success, html_text];
+        return [success, data];
     }
 
     function html_error_message(title, message) {
@@ -209,25 +316,76 @@
         return `<div class="text"><div class="column centered"><h1>${title}</h1><p>${message}</p><hr></div></div>`;
     }
 
-    function createFrame([success, html_text]) {
-        let serial, eof, error;
+    function createFrames(baseCellStates, success, data) {
+        if (!success) {
+            return [{html_text: data, serial: NaN, eof: true, error: true}];
+        }
+
+        const frames = [];
+
+        if (data instanceof ArrayBuffer) {
+            // see helpers.render_binary_worlds
+            let offset = 0;
+            while (offset < data.byteLength) {
+                const header = new DataView(data, offset, BINARY_WORLD_HEADER_SIZE);
+                const serial = header.getUint32(0, true);
+                const flags = header.getUint32(4, true);
+                const eof = (flags & GAME_OVER_FLAG) !== 0;
+                offset += BINARY_WORLD_HEADER_SIZE;
+
+                if (flags & DELTA_FLAG) {
+                    // XOR with the previous frame: records of offset, length and bytes (see world.history.encode_delta)
+                    const delta = new DataView(data, offset + 4, new DataView(data, offset, 4).getUint32(0, true));
+                    const cellStates = baseCellStates.slice();
+                    const changed = [];
+                    let pos = 0;
+                    while (pos < delta.byteLength) {
+                        const start = delta.getUint32(pos, true) >> 2;
+                        const length = delta.getUint32(pos + 4, true) >> 2;
+                        pos += 8;
+                        for (let i = start; i < start + length; ++i, pos += 4) {
+                            cellStates[i] ^= delta.getUint32(pos, true);
+                            changed.push(i);
+                        }
+                    }
+                    frames.push({cellStates, changed, serial, eof});
+                    baseCellStates = cellStates;
+                    offset += 4 + delta.byteLength;
+                } else {
+                    const records = (header.getUint32(8, true) * header.getUint32(12, true) + 15) >> 4;
+                    const cellStates = new Uint32Array(data, offset, records);
+                    frames.push({cellStates, serial, eof});
+                    baseCellStates = cellStates;
+                    offset += records << 2;
+                }
+            }
+            return frames;
+        }
 
-        if (success) {
+        // see helpers.render_plain_worlds
+        const lines = data.split('\n');
+        let i = 0;
+        while (i < lines.length) {
             // get 'serial' from fist line
-            let [_start, _end] = [0, html_text.indexOf('\n')]
-            serial = parseInt(html_text.substring(_start, _end));
-            _start = _end + 1;
+            const serial = parseInt(lines[i++]);
 
             // check the 'game over' in the second line
-            _end = html_text.indexOf('\n', _start);
-            eof = html_text.substring(_start, _end).toLowerCase() === "game over";
-        } else {
-            serial = NaN;
-            error = true;
-            eof = true;
+            const eof = lines[i++].toLowerCase() === "game over";
+
+            // get cell states from next rows up to the empty line
+            let end = lines.indexOf('', i);
+            if (end === -1) {
+                end = lines.length;
+            }
+            const cellStates = new Uint32Array(end - i);
+            for (let j = 0; j < cellStates.length; ++j) {
+                cellStates[j] = parseInt(lines[i + j]);
+            }
+            frames.push({cellStates, serial, eof});
+            i = end + 1;
         }
 
-        return {html_text, serial, eof, error};
+        return frames;
     }
 
     // ------------------------------------------------------------------------
@@ -246,7 +404,7 @@
             if (frame.error) {
                 showError(frame.html_text)
             } else {
-                showWorld(frame.html_text);
+                showWorld(frame);
                 latestShownWorld = frame.serial;
             }
 
@@ -272,36 +430,32 @@
         }
     }
 
-    function showWorld(text) {
-        const lines = text.split('\n');
-
-        // get counter from first line
+    function showWorld({serial, eof, cellStates: newCellStates, changed}) {
         if (counter) {
-            counter.textContent = lines[0];
+            counter.textContent = serial.toString();
         }
 
-        // get header from second line
         if (wordHeader) {
-            wordHeader.innerHTML = `<h2>${lines[1]}</h2>`;
+            wordHeader.innerHTML = `<h2>${eof ? 'GAME OVER' : ''}</h2>`;
         }
 
-        // get cell states from next rows
-        const newCellStates = new Uint32Array(lines.length - 2);
-        for (let i = 0; i < newCellStates.length; ++i) {
-            newCellStates[i] = parseInt(lines[i + 2]);
+        if (cells === undefined) {
+            cells = Array.from(worldTable.rows, tr => Array.from(tr.cells)).flat();
         }
 
-        let i = 0;
-        for (const tr of worldTable.rows) {
-            for (const td of tr.cells) {
-                const record = i >> 4;
+        // A delta frame lists the changed records, so the other cells are the same as on the screen
+        const records = changed !== undefined && latestCellStates !== undefined ?
+            changed : newCellStates.keys();
+
+        for (const record of records) {
+            const end = Math.min((record + 1) << 4, cells.length);
+            for (let i = record << 4; i < end; i++) {
                 const offset = (i << 1) & 31;
                 const cell_state = (newCellStates[record] >> offset) & 3;
                 if (latestCellStates === undefined || cell_state !== ((latestCellStates[record] >> offset) & 3)) {
-                    td.className = CELL_CLASS[cell_state];
-                    // td.style.backgroundColor = CELL_COLOR[cell_state]
+                    cells[i].className = CELL_CLASS[cell_state];
+                    // cells[i].style.backgroundColor = CELL_COLOR[cell_state]
                 }
-                i++;
             }
         }
         latestCellStates = newCellStates;
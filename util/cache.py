@@ -0,0 +1,59 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple, List
+
+# Approximate size of the cached responses in bytes (0 - don't cache)
+_RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 32 << 20))
+
+# Approximate size of the headers and the bookkeeping of a cached response in bytes
+_ENTRY_OVERHEAD = 512
+
+
+class ResponseCache:
+    """
+    The rendered responses (body and headers) by their ETags. When the cache exceeds its size, we evict the least
+    recently used responses. The cache is shared by the sessions, so it has its own lock.
+    """
+
+    def __init__(self, size: int = _RESPONSE_CACHE_SIZE):
+        self._budget = size
+        self._size = 0
+        self._entries: OrderedDict[str, Tuple[bytes, List[Tuple[str, str]]]] = OrderedDict()
+        self._lock = Lock()
+
+        self.hit_count = 0
+        self.miss_count = 0
+
+    @property
+    def size(self) -> int:
+        """Approximate size of the cached responses in bytes"""
+        return self._size
+
+    def get(self, etag: str) -> Optional[Tuple[bytes, List[Tuple[str, str]]]]:
+        """Returns (body, headers) of the response or None"""
+
+        with self._lock:
+            entry = self._entries.get(etag)
+            if entry is None:
+                self.miss_count += 1
+            else:
+                self.hit_count += 1
+                self._entries.move_to_end(etag)
+            return entry
+
+    def put(self, etag: str, body: bytes, headers: List[Tuple[str, str]]) -> None:
+        entry_size = len(body) + _ENTRY_OVERHEAD
+        if entry_size > self._budget:
+            return
+
+        with self._lock:
+            if etag in self._entries:
+                return
+
+            self._entries[etag] = body, headers
+            self._size += entry_size
+
+            while self._size > self._budget:
+                _, (evicted_body, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted_body) + _ENTRY_OVERHEAD
@@ -0,0 +1,198 @@
+"""
+Metrics of the application in the Prometheus text format (without the client library).
+
+https://prometheus.io/docs/instrumenting/exposition_formats/
+
+The metrics are created at the module level, and registered in `REGISTRY`:
+
+    _STEP_SECONDS = Histogram('life_step_seconds', "Calculation of the next world", ('kind',))
+    ...
+    with _STEP_SECONDS.labels('step').time():
+        world = create_next_world(factory, world)
+
+The values of the gauges are calculated by their functions, when the metrics are collected.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# The upper bounds of the buckets of a histogram (seconds), from a step of a small world to a slow request
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    _type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self._name = name
+        self._documentation = documentation
+        self._label_names = tuple(label_names)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = Lock()
+
+        REGISTRY.register(self)
+
+    def labels(self, *values: str):
+        """Returns the metric with the values of the labels"""
+
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self._label_names):
+                raise ValueError(f"{self._name} has labels {self._label_names}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._create_child())
+        return child
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self._name} {self._documentation}", f"# TYPE {self._name} {self._type}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._collect_child(values, child))
+        return lines
+
+    def _format_labels(self, values: Tuple[str, ...], *extra: Tuple[str, str]) -> str:
+        labels = [*zip(self._label_names, values), *extra]
+        if not labels:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+    def _create_child(self):
+        raise NotImplementedError
+
+    def _collect_child(self, values: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    _type = 'counter'
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _create_child(self):
+        return _CounterChild()
+
+    def _collect_child(self, values: Tuple[str, ...], child: _CounterChild) -> List[str]:
+        return [f"{self._name}{self._format_labels(values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+
+    def __init__(self, buckets: Sequence[float]):
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observe the time (seconds) of the `with` block"""
+
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start)
+
+
+class Histogram(_Metric):
+    _type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self._buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _create_child(self):
+        return _HistogramChild(self._buckets)
+
+    def _collect_child(self, values: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+
+        labels = self._format_labels(values)
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*map(_format_value, self._buckets), '+Inf'), counts):
+            cumulative += count
+            lines.append(f"{self._name}_bucket{self._format_labels(values, ('le', bound))} {cumulative}")
+        lines.append(f"{self._name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self._name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """The gauge calculated by the function, when the metrics are collected"""
+
+    _type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        self._function = function
+        super().__init__(name, documentation)
+
+    def collect(self) -> List[str]:
+        return [f"# HELP {self._name} {self._documentation}", f"# TYPE {self._name} {self._type}",
+                f"{self._name} {_format_value(self._function())}"]
+
+
+class CallbackCounter(Gauge):
+    """The counter kept by another object, its value is returned by the function"""
+
+    _type = 'counter'
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._lock = Lock()
+
+    def register(self, metric: _Metric) -> None:
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text format"""
+
+        with self._lock:
+            metrics = list(self._metrics)
+        return ''.join(line + '\n' for metric in metrics for line in metric.collect())
+
+
+REGISTRY = Registry()
+
+# The content type of `Registry.render`
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
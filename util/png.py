@@ -0,0 +1,42 @@
+"""
+A minimal PNG encoder (only the standard library): 8-bit palette images.
+
+https://www.w3.org/TR/png/
+"""
+
+import zlib
+from struct import Struct
+from typing import Iterable, Sequence, Tuple
+
+_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_CHUNK_HEADER = Struct('>I4s')
+_CHUNK_CRC = Struct('>I')
+_IHDR = Struct('>IIBBBBB')
+
+_BIT_DEPTH = 8
+_PALETTE_COLOR_TYPE = 3
+_NO_FILTER = b'\x00'
+
+
+def encode_palette_png(width: int, height: int, rows: Iterable[bytes], palette: Sequence[Tuple[int, int, int]],
+                       level: int = 6) -> bytes:
+    """
+    Returns the PNG image of the rows of pixels (a byte per pixel, the index of the color in the palette). The rows
+    are compressed one by one, so they can be generated.
+    """
+
+    compressor = zlib.compressobj(level)
+    data = [compressor.compress(_NO_FILTER + row) for row in rows]
+    data.append(compressor.flush())
+
+    return b''.join((
+        _SIGNATURE,
+        _chunk(b'IHDR', _IHDR.pack(width, height, _BIT_DEPTH, _PALETTE_COLOR_TYPE, 0, 0, 0)),
+        _chunk(b'PLTE', bytes(component for color in palette for component in color)),
+        _chunk(b'IDAT', b''.join(data)),
+        _chunk(b'IEND', b''),
+    ))
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return _CHUNK_HEADER.pack(len(data), chunk_type) + data + _CHUNK_CRC.pack(zlib.crc32(chunk_type + data))
@@ -0,0 +1,125 @@
+import cProfile
+import json
+import os
+import random
+import time
+from threading import Lock
+from typing import Optional, List
+
+# Directory for the profiles of the requests (empty - don't profile)
+_PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+
+# Share of the requests to profile (0 - only the requests with the `PROFILE_HEADER`)
+_PROFILE_RATE = float(os.environ.get('PROFILE_RATE', 0))
+
+# Requests with this header (any value except "0") are always profiled, if the profiling is public
+PROFILE_HEADER = 'X-Profile'
+
+# Let any client profile its requests with the `PROFILE_HEADER` and read the profiles at /profiles (off - only in the
+# debug mode)
+_PROFILE_PUBLIC = bool(int(os.environ.get('PROFILE_PUBLIC', 0)))
+
+# Keep so many last profiles in the directory
+_PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+
+_PROFILE_SUFFIX = '.prof'
+_INFO_SUFFIX = '.json'
+
+
+class RequestProfiler:
+    """
+    Profiles the chosen requests with `cProfile` and writes the profiles (`.prof`, see `pstats`) with their info (the
+    route, the world size, the serial... in `.json`) to the directory. Only one request is profiled at a time (Python
+    allows one active profiler), the concurrent requests are not profiled. Only the thread of the request is profiled:
+    the generations calculated in the background (see `GameOfLife._produce`) look like waiting.
+    """
+
+    def __init__(self, directory: str, rate: float = 0.0, max_files: int = 100, public: bool = False):
+        self._directory = directory
+        self._rate = rate
+        self._max_files = max_files
+        self._public = public
+        self._lock = Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @property
+    def public(self) -> bool:
+        """Whether the clients can request the profiling (see `PROFILE_HEADER`) and read the profiles"""
+        return self._public
+
+    def should_profile(self, header: Optional[str]) -> bool:
+        if header is not None and self._public:
+            return header != '0'
+        return self._rate > 0 and random.random() < self._rate
+
+    def start(self) -> Optional[cProfile.Profile]:
+        """Start profiling the current thread, returns None if another request is being profiled"""
+
+        if not self._lock.acquire(blocking=False):
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiling tool is active
+            self._lock.release()
+            return None
+        return profile
+
+    def stop(self, profile: cProfile.Profile, info: dict) -> str:
+        """Stop profiling and write the profile with the info, returns the name of the profile"""
+
+        try:
+            profile.disable()
+        finally:
+            self._lock.release()
+
+        now = time.time()
+        name = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f'-{int(now * 1e6) % 1000000:06d}-{os.getpid()}'
+
+        path = os.path.join(self._directory, name)
+        profile.dump_stats(path + _PROFILE_SUFFIX)
+        with open(path + _INFO_SUFFIX, 'w') as file:
+            json.dump(dict(info, name=name + _PROFILE_SUFFIX, time=now), file)
+
+        self._remove_old_profiles()
+        return name + _PROFILE_SUFFIX
+
+    def recent_profiles(self, count: int = 100) -> List[dict]:
+        """Returns the info of the last profiles (the last first)"""
+
+        profiles = []
+        for name in self._names()[-count:][::-1]:
+            try:
+                with open(os.path.join(self._directory, name + _INFO_SUFFIX)) as file:
+                    profiles.append(json.load(file))
+            except (OSError, ValueError):
+                # removed or being written by another process
+                continue
+        return profiles
+
+    def _names(self) -> List[str]:
+        """The names of the profiles from the first to the last"""
+        return sorted(name[:-len(_INFO_SUFFIX)] for name in os.listdir(self._directory) if name.endswith(_INFO_SUFFIX))
+
+    def _remove_old_profiles(self) -> None:
+        names = self._names()
+        for name in names[:max(len(names) - self._max_files, 0)]:
+            for suffix in (_INFO_SUFFIX, _PROFILE_SUFFIX):
+                try:
+                    os.remove(os.path.join(self._directory, name + suffix))
+                except OSError:
+                    # removed by another process
+                    pass
+
+
+def create_request_profiler(debug: bool = False) -> Optional[RequestProfiler]:
+    if not _PROFILE_DIR:
+        return None
+    return RequestProfiler(_PROFILE_DIR, _PROFILE_RATE, _PROFILE_MAX_FILES, _PROFILE_PUBLIC or debug)
@@ -1,10 +1,25 @@
+import os
+import time
+from collections import OrderedDict
 from uuid import uuid4
-from threading import Lock
+from threading import Lock, Condition
 from flask import session as flask_session
-from typing import Optional
+from typing import List, Optional
 
+from util.metrics import CallbackCounter, Gauge, Histogram
 from util.singleton import SingletonMeta
 
+# Seconds without requests after which the session is removed
+_SESSION_TTL = float(os.environ.get('SESSION_TTL', 3600))
+
+# Approximate size of all sessions in bytes. If it's exceeded, the least recently used sessions are removed.
+_SESSIONS_BUDGET = int(os.environ.get('SESSIONS_BUDGET', 256 << 20))
+
+# Seconds between the checks of the sessions
+_EVICTION_INTERVAL = 1.0
+
+_LOCK_WAIT_SECONDS = Histogram('life_session_lock_wait_seconds', "Waiting for the session context")
+
 
 class SessionContentError(Exception):
     pass
@@ -18,7 +33,12 @@ class SessionService(metaclass=SingletonMeta):
     _fss_key = "xG4chG9PdKExwbGmR4"
 
     def __init__(self):
-        self._contexts = {}
+        # The contexts in the order of the last access (the least recently used first)
+        self._contexts: OrderedDict[str, SessionContext] = OrderedDict()
+        self._next_eviction = 0.0
+
+        self.expired_count = 0  # sessions removed by the TTL
+        self.evicted_count = 0  # sessions removed to fit the budget
 
     @classmethod
     def _get_session_key(cls) -> Optional[str]:
@@ -41,13 +61,53 @@ class SessionService(metaclass=SingletonMeta):
         if key is None:
             raise SessionContentError("Can't get session key")
 
+        now = time.monotonic()
+
         with self._lock:
             context = self._contexts.get(key)
             if context is None:
-                self._contexts[key] = context = SessionContext()
+                self._contexts[key] = context = SessionContext(key)
+            else:
+                self._contexts.move_to_end(key)
+            context.last_access = now
+
+            if now >= self._next_eviction:
+                self._next_eviction = now + _EVICTION_INTERVAL
+                self._evict(now)
 
         return context
 
+    @property
+    def session_count(self) -> int:
+        return len(self._contexts)
+
+    @property
+    def contexts(self) -> List['SessionContext']:
+        return list(self._contexts.values())
+
+    @property
+    def size(self) -> int:
+        """Approximate size of all sessions in bytes"""
+        return sum(context.size for context in self.contexts)
+
+    def _evict(self, now: float) -> None:
+        """Remove the expired sessions, and then the least recently used ones while the sessions exceed the budget"""
+
+        contexts = self._contexts
+
+        while contexts:
+            key, context = next(iter(contexts.items()))
+            if now - context.last_access <= _SESSION_TTL:
+                break
+            del contexts[key]
+            self.expired_count += 1
+
+        size = self.size
+        while size > _SESSIONS_BUDGET and len(contexts) > 1:
+            _, context = contexts.popitem(last=False)
+            size -= context.size
+            self.evicted_count += 1
+
 
 class SessionContext:
     """
@@ -63,23 +123,54 @@ class SessionContext:
 
         # save data to context
         context.data['foo'] = foo
+
+    Inside `with` you can release the context to wait for changes made by another thread:
+
+    with context:
+        while not context.data.get('ready'):
+            context.wait()
     """
 
-    def __init__(self):
+    # Approximate size of an empty session in bytes
+    _OVERHEAD = 1024
+
+    def __init__(self, key: Optional[str] = None):
+        self._key = key
         self._data = {}
-        self._lock = Lock()
+        self._lock = Condition(Lock())
+        self.last_access = time.monotonic()
 
     def __enter__(self):
+        start = time.perf_counter()
         self._lock.acquire()
+        _LOCK_WAIT_SECONDS.observe(time.perf_counter() - start)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._lock.release()
 
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Release the context until `notify_all` is called or the timeout expires (MUST be called inside `with`)"""
+        return self._lock.wait(timeout)
+
+    def notify_all(self) -> None:
+        """Wake up all threads waiting for the context (MUST be called inside `with`)"""
+        self._lock.notify_all()
+
+    @property
+    def key(self) -> Optional[str]:
+        """The session key (the same in all worker processes)"""
+        return self._key
+
     @property
     def data(self) -> dict:
         return self._data
 
+    @property
+    def size(self) -> int:
+        """Approximate size of the session in bytes. The data values can report their size with the `size` property."""
+        return self._OVERHEAD + sum(getattr(value, 'size', 0) for value in list(self._data.values()))
+
     def get(self, key):
         return self._data.get(key)
 
@@ -94,3 +185,9 @@ class SessionContext:
         if data is None:
             self._data[key] = data = []
         return data
+
+
+Gauge('life_sessions', "Live sessions", lambda: SessionService().session_count)
+CallbackCounter('life_sessions_expired_total', "Sessions removed by the TTL", lambda: SessionService().expired_count)
+CallbackCounter('life_sessions_evicted_total', "Sessions removed to fit the budget",
+                lambda: SessionService().evicted_count)
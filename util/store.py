@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import time
+from abc import ABCMeta, abstractmethod
+from threading import local
+from typing import Optional, Tuple
+
+# Path to the SQLite database shared by the worker processes (empty - keep the games only in the process memory)
+_SESSION_DB = os.environ.get('SESSION_DB', '')
+
+# Seconds without requests after which the game is removed from the store (the same as for the sessions)
+_SESSION_TTL = float(os.environ.get('SESSION_TTL', 3600))
+
+# Don't update the access time of the game more often (seconds)
+_ACCESS_UPDATE_INTERVAL = 60.0
+
+
+class WorldStore:
+    """
+    The games of the sessions shared by the worker processes. The store keeps only the packed worlds (in the canonical
+    form, see `world.canonical`) that can't be calculated quickly: the first world of the game and the keyframes.
+    The other worlds each process calculates itself.
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def create_game(self, key: str, width: int, height: int, rule: str, data: bytes) -> int:
+        """Replace the game of the session with a new one starting from the world (generation 0), returns its ID"""
+
+    @abstractmethod
+    def get_game(self, key: str) -> Optional[Tuple[int, int, int, str]]:
+        """Returns (ID, width, height, rule) of the game of the session or None"""
+
+    @abstractmethod
+    def add_world(self, game_id: int, serial: int, data: bytes) -> None:
+        """Store the world of the game (if it's not stored yet)"""
+
+    @abstractmethod
+    def find_world(self, game_id: int, serial: int) -> Optional[Tuple[int, bytes]]:
+        """Returns (serial, world) of the nearest stored world of the game not later than the serial or None"""
+
+    @abstractmethod
+    def set_game_over(self, game_id: int, serial: int, repeated_serial: int) -> None:
+        """Remember the generation in which the game is over (the earliest one is kept)"""
+
+    @abstractmethod
+    def get_game_over(self, game_id: int) -> Optional[Tuple[int, int]]:
+        """Returns (serial, repeated serial) of the generation in which the game is over or None"""
+
+
+class SQLiteWorldStore(WorldStore):
+    """
+    The store in the SQLite database. SQLite locks the database file, so the processes can change it concurrently.
+    Each thread has its own connection.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            rule TEXT NOT NULL DEFAULT 'B3/S23',
+            over_serial INTEGER,
+            repeated_serial INTEGER,
+            accessed REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS worlds (
+            game INTEGER NOT NULL,
+            serial INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (game, serial)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, path: str, ttl: float = _SESSION_TTL):
+        self._path = path
+        self._ttl = ttl
+        self._local = local()
+
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")  # the worlds can be recalculated, so we don't wait for the disk
+        db.executescript(self._SCHEMA)
+
+        # the databases created before the rules
+        columns = [row[1] for row in db.execute("PRAGMA table_info(games)")]
+        if 'rule' not in columns:
+            with db:
+                db.execute("ALTER TABLE games ADD COLUMN rule TEXT NOT NULL DEFAULT 'B3/S23'")
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            self._local.db = db = sqlite3.connect(self._path, timeout=30)
+        return db
+
+    def create_game(self, key: str, width: int, height: int, rule: str, data: bytes) -> int:
+        now = time.time()
+        with self._connection() as db:
+            # remove the previous game of the session and the expired games
+            expired = "SELECT id FROM games WHERE key = ? OR accessed < ?"
+            db.execute(f"DELETE FROM worlds WHERE game IN ({expired})", (key, now - self._ttl))
+            db.execute("DELETE FROM games WHERE key = ? OR accessed < ?", (key, now - self._ttl))
+
+            game_id = db.execute("INSERT INTO games (key, width, height, rule, accessed) VALUES (?, ?, ?, ?, ?)",
+                                 (key, width, height, rule, now)).lastrowid
+            db.execute("INSERT INTO worlds (game, serial, data) VALUES (?, 0, ?)", (game_id, data))
+
+        return game_id
+
+    def get_game(self, key: str) -> Optional[Tuple[int, int, int, str]]:
+        db = self._connection()
+        row = db.execute("SELECT id, width, height, rule, accessed FROM games WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        game_id, width, height, rule, accessed = row
+        now = time.time()
+        if now - accessed > _ACCESS_UPDATE_INTERVAL:
+            with db:
+                db.execute("UPDATE games SET accessed = ? WHERE id = ?", (now, game_id))
+
+        return game_id, width, height, rule
+
+    def add_world(self, game_id: int, serial: int, data: bytes) -> None:
+        with self._connection() as db:
+            db.execute("INSERT OR IGNORE INTO worlds (game, serial, data) VALUES (?, ?, ?)", (game_id, serial, data))
+
+    def find_world(self, game_id: int, serial: int) -> Optional[Tuple[int, bytes]]:
+        return self._connection().execute(
+            "SELECT serial, data FROM worlds WHERE game = ? AND serial <= ? ORDER BY serial DESC LIMIT 1",
+            (game_id, serial)).fetchone()
+
+    def set_game_over(self, game_id: int, serial: int, repeated_serial: int) -> None:
+        with self._connection() as db:
+            db.execute("UPDATE games SET over_serial = ?, repeated_serial = ? "
+                       "WHERE id = ? AND (over_serial IS NULL OR over_serial > ?)",
+                       (serial, repeated_serial, game_id, serial))
+
+    def get_game_over(self, game_id: int) -> Optional[Tuple[int, int]]:
+        return self._connection().execute(
+            "SELECT over_serial, repeated_serial FROM games WHERE id = ? AND over_serial IS NOT NULL",
+            (game_id,)).fetchone()
+
+
+def create_world_store() -> Optional[WorldStore]:
+    """Returns the configured store or None if the games are kept only in the process memory"""
+
+    return SQLiteWorldStore(_SESSION_DB) if _SESSION_DB else None
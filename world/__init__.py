@@ -1,16 +1,18 @@
 import os
-from array import array
 from abc import ABCMeta, abstractmethod
 
-from util.bitarray import makeBitArray, setBit, testBit
+from world.canonical import (array_from_bytes, bitarray_from_bytes, bitarray_to_bytes, crop_bits, interleave_bits,
+                             size_in_bytes)
+from world.rules import CONWAY, Rule
 
 
 class AbstractWorldFactory:
     __metaclass__ = ABCMeta
 
-    def __init__(self, width: int, height: int):
+    def __init__(self, width: int, height: int, rule: Rule = CONWAY):
         self._width = width
         self._height = height
+        self._rule = rule
 
     @property
     def width(self) -> int:
@@ -20,6 +22,11 @@ class AbstractWorldFactory:
     def height(self) -> int:
         return self._height
 
+    @property
+    def rule(self) -> Rule:
+        """The Life-like rule of the worlds (see `world.rules`)"""
+        return self._rule
+
     @abstractmethod
     def is_live_cell(self, world, row: int, col: int) -> bool:
         """Returns true if cell of world is live or false otherwise"""
@@ -42,55 +49,44 @@ class AbstractWorldFactory:
 
     @abstractmethod
     def create_next_world(self, world):
-        """Create new world based on the existing world"""
+        """Create new world based on the existing world by the rule"""
 
-    def create_world_from_array(self, array_):
-        """Create new world from the bitarray"""
+    @abstractmethod
+    def world_to_bytes(self, world) -> bytes:
+        """Returns the world in the canonical form (see `world.canonical`) to store, compare and send the worlds"""
 
-        new_world = self.create_empty_world()
+    @abstractmethod
+    def world_from_bytes(self, data: bytes):
+        """Create new world from the canonical form returned by `world_to_bytes`"""
 
-        i = 0
-        for row in range(self._height):
-            for col in range(self._width):
-                if testBit(array_, i):
-                    self.revive_cell(new_world, row, col)
-                i += 1
+    def window_to_bytes(self, world, x: int, y: int, width: int, height: int) -> bytes:
+        """Returns the rectangle of the world in the canonical form (the engines can avoid converting the whole world)"""
 
-        return new_world
+        return crop_bits(self.world_to_bytes(world), self._width, x, y, width, height)
 
-    def pack_world_into_array(self, world):
-        """Pack the world into a bitarray"""
+    def create_world_from_array(self, array_):
+        """Create new world from the bitarray"""
 
-        array_ = makeBitArray(self._width * self._height, fill=0)
+        return self.world_from_bytes(bitarray_to_bytes(array_, size_in_bytes(self._width, self._height)))
 
-        i = 0
-        for row in range(self._height):
-            for col in range(self._width):
-                if self.is_live_cell(world, row, col):
-                    setBit(array_, i)
-                i += 1
+    def pack_world_into_array(self, world):
+        """Pack the world into a bitarray"""
 
-        return array_
+        return bitarray_from_bytes(self.world_to_bytes(world))
 
     def pack_two_worlds_into_array(self, prev_world, cur_world):
         """Pack two worlds (previous and current) into an uint32 array (2 bit per cell)"""
 
-        size = self._width * self._height * 2
-        array_ = array('L', (0,) * ((size + 31) >> 5))
-
-        i = 0
-        for row in range(self._height):
-            for col in range(self._width):
-                value = self.is_live_cell(cur_world, row, col) | (self.is_live_cell(prev_world, row, col) << 1)
-                record = i >> 5
-                offset = i & 31
-                array_[record] |= value << offset
-                i += 2
-
-        return array_
+        data = interleave_bits(self.world_to_bytes(cur_world), self.world_to_bytes(prev_world))
+        size = ((self._width * self._height + 15) >> 4) << 2
+        return array_from_bytes('I', data + bytes(size - len(data)))
 
 
 if int(os.environ.get('NAIVE_ALGO', 0)):
     from .bitarray import WorldFactory
+elif int(os.environ.get('NUMPY_ALGO', 0)):
+    from .vectorized import WorldFactory
+elif int(os.environ.get('ACTIVE_REGION_ALGO', 0)):
+    from .active64 import WorldFactory
 else:
     from .world64 import WorldFactory
@@ -0,0 +1,96 @@
+from array import array
+
+from world import world64
+from world.rules import CONWAY, Rule, compile_kernel, insert_code
+
+# A record is stored into the copy of the current world only if it has changed, and the changes are collected into
+# {record: changed bits}
+_STORE_CHANGED = """
+if num != cell:
+    new_world[i] = num
+    changed[i] = num ^ cell
+"""
+
+# The calculation of the whole world (see `world64.NEXT_WORLD_TEMPLATE`)
+_NEXT_WORLD_SOURCE = insert_code(world64.NEXT_WORLD_TEMPLATE, next_record=world64.NEXT_RECORD_SOURCE,
+                                 store=_STORE_CHANGED)
+
+# The calculation of the active records
+_NEXT_RECORDS_SOURCE = insert_code("""
+def next_records(world, new_world, subtotals, active, row_size, columns, changed):
+    for i in active:
+        r0 = i - i % row_size
+        c0, c1, c2, last_left, last, mask = columns[i - r0]
+        {next_record}
+        {store}
+""", next_record=world64.NEXT_RECORD_SOURCE, store=_STORE_CHANGED)
+
+
+class _World(array):
+    """The world that remembers which records have changed since the previous generation"""
+
+    changed = None
+
+
+class WorldFactory(world64.WorldFactory):
+    """
+    The same as `world64`, but recalculates only the records whose neighbourhood has changed since the previous
+    generation. All other records are copied from the current world: still lifes do not cost anything.
+    """
+
+    # If more records have changed, it's cheaper to recalculate the whole world
+    _MAX_ACTIVE_PART = 0.2
+
+    def __init__(self, width, height, rule: Rule = CONWAY):
+        super(WorldFactory, self).__init__(width, height, rule)
+
+        self._next_world_changes = compile_kernel(_NEXT_WORLD_SOURCE, 'next_world', self._rule)
+        self._next_records = compile_kernel(_NEXT_RECORDS_SOURCE, 'next_records', self._rule)
+
+    def create_next_world(self, world):
+        changed = world.changed if isinstance(world, _World) else None
+
+        if changed is None or len(changed) > self._size * self._MAX_ACTIVE_PART:
+            # see world64.WorldFactory.create_next_world
+            new_world = _World('Q', world)
+            new_world.changed = {}
+            self._next_world_changes(world, new_world, self._row_size, self._size, self._columns, new_world.changed)
+            return new_world
+
+        row_size, size = self._row_size, self._size
+        subtotals = array('Q', bytes(size << 3))
+
+        # A record of the next world depends only on the records above and below it, and on the edge cells of the
+        # records on the left and right. So we need to recalculate the changed records, the records above and below
+        # them, and the records on the left (right) if the first (last) cell of the record has changed...
+
+        active = set()
+        for i, diff in changed.items():
+            c0, c1, c2, _, last, _ = self._columns[i % row_size]
+            columns = [c0]
+            if diff & 0xF:
+                columns.append(c1)
+            if diff >> last:
+                columns.append(c2)
+            for r in ((i - c0 - row_size) % size, i - c0, (i - c0 + row_size) % size):
+                for c in columns:
+                    active.add(r + c)
+
+        # ... and the vertical subtotals for them and their horizontal neighbours.
+
+        required = set()
+        for i in active:
+            c0 = i % row_size
+            r0 = i - c0
+            required.add(r0 + (c0 - 1) % row_size)
+            required.add(i)
+            required.add(r0 + (c0 + 1) % row_size)
+
+        for i in required:
+            subtotals[i] = world[i] + world[(i - row_size) % size] + world[(i + row_size) % size]
+
+        # see world64.WorldFactory.create_next_world
+        new_world = _World('Q', world)
+        new_world.changed = {}
+        self._next_records(world, new_world, subtotals, active, row_size, self._columns, new_world.changed)
+        return new_world
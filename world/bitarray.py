@@ -2,12 +2,14 @@ from array import array
 
 from util.bitarray import getBit, makeBitArray, setBit, clearBit
 from world import AbstractWorldFactory
+from world.canonical import bitarray_from_bytes, bitarray_to_bytes, compact_bits, size_in_bytes, spread_bits
+from world.rules import CONWAY, Rule
 
 
 class WorldFactory(AbstractWorldFactory):
 
-    def __init__(self, width, height):
-        super(WorldFactory, self).__init__(width, height)
+    def __init__(self, width, height, rule: Rule = CONWAY):
+        super(WorldFactory, self).__init__(width, height, rule)
 
         # To improve the performance of packing the previous and current worlds into an array,
         # we allocate 2 bit per cell
@@ -34,14 +36,15 @@ class WorldFactory(AbstractWorldFactory):
 
     def create_next_world(self, world):
         """
-        1. Any live cell with two or three live neighbours survives.
-        2. Any dead cell with three live neighbours becomes a live cell.
+        1. Any live cell with a number of live neighbours in the survival list of the rule survives.
+        2. Any dead cell with a number of live neighbours in the birth list of the rule becomes a live cell.
         3. All other live cells die in the next generation. Similarly, all other dead cells stay dead.
 
         https://en.wikipedia.org/wiki/Conway%27s_Game_of_Life#Rules
         """
 
         size, row_size, height = self._size, self._row_size, self._height
+        birth, survival = self._rule
         new_world = makeBitArray(size)
 
         # Calculate indexes
@@ -70,11 +73,17 @@ class WorldFactory(AbstractWorldFactory):
                               getBit(world, r2 + c1) + getBit(world, r2 + c2) + getBit(world, r2 + c0))
 
                 i = r0 + c0
-                if neighbours == 3 or neighbours == 2 and getBit(world, i):
+                if neighbours in (survival if getBit(world, i) else birth):
                     setBit(new_world, i)
 
         return new_world
 
+    def world_to_bytes(self, world) -> bytes:
+        return compact_bits(bitarray_to_bytes(world, len(world) << 2), 2)[:size_in_bytes(self._width, self._height)]
+
+    def world_from_bytes(self, data: bytes):
+        return bitarray_from_bytes(spread_bits(data, 2))
+
     def pack_two_worlds_into_array(self, prev_world, cur_world):
         result = array('L')
         for num0, num1 in zip(cur_world, prev_world):
@@ -0,0 +1,168 @@
+"""
+The canonical form of a world: 1 bit per cell, row by row, the lowest bit of a byte first, `ceil(width * height / 8)`
+bytes (the unused bits of the last byte are 0). It's used to store, compare and send the worlds, and the engines
+convert their worlds to it and back.
+
+The conversions work on the whole world as one big integer, so they take a few bulk operations instead of a loop
+over the cells (see "Interleave bits by Binary Magic Numbers", https://graphics.stanford.edu/~seander/bithacks.html).
+"""
+
+import sys
+from array import array
+from functools import lru_cache
+from typing import List
+
+# To spread the bits of each byte over `stride` bytes, we shift the bits in halves, quarters and so on, and mask them.
+# The steps are (shift, mask pattern), the patterns are repeated over the whole world.
+_SPREAD_STEPS = {
+    2: ((4, b'\x0f'), (2, b'\x33'), (1, b'\x55')),
+    4: ((12, b'\x0f\x00'), (6, b'\x03'), (3, b'\x11')),
+    8: ((28, b'\x0f\x00\x00\x00'), (14, b'\x03\x00'), (7, b'\x01')),
+}
+
+
+@lru_cache(maxsize=64)
+def _mask(pattern: bytes, size: int) -> int:
+    return int.from_bytes(pattern * (size // len(pattern)), 'little')
+
+
+def size_in_bytes(width: int, height: int) -> int:
+    return (width * height + 7) >> 3
+
+
+def spread_bits(data: bytes, stride: int) -> bytes:
+    """Returns the bits of the data placed every `stride` bits (the other bits are 0)"""
+
+    spread = bytearray(len(data) * stride)
+    spread[::stride] = data
+    size = len(spread)
+
+    bits = int.from_bytes(spread, 'little')
+    for shift, pattern in _SPREAD_STEPS[stride]:
+        bits = (bits | (bits << shift)) & _mask(pattern, size)
+
+    return bits.to_bytes(size, 'little')
+
+
+def compact_bits(data: bytes, stride: int) -> bytes:
+    """Returns every `stride`-th bit of the data (the reverse of `spread_bits`)"""
+
+    size = len(data) - len(data) % stride
+    steps = _SPREAD_STEPS[stride]
+
+    bits = int.from_bytes(data[:size], 'little') & _mask(steps[-1][1], size)
+    masks = [pattern for shift, pattern in steps[:-1]]
+    masks.insert(0, b'\xff' + b'\x00' * (stride - 1))
+    for (shift, _), pattern in zip(reversed(steps), reversed(masks)):
+        bits = (bits | (bits >> shift)) & _mask(pattern, size)
+
+    return bits.to_bytes(size, 'little')[::stride]
+
+
+def join_rows(rows: List[int], width: int) -> bytes:
+    """Returns the rows (the bits of each row as an integer, the first cell in the lowest bit) in the canonical form"""
+
+    row_size = (width + 7) >> 3
+    if width & 7 == 0:
+        return b''.join(row.to_bytes(row_size, 'little') for row in rows)
+
+    # the rows are not aligned with the bytes, but each 8 rows are
+    chunks = []
+    for first in range(0, len(rows), 8):
+        bits = 0
+        for row in reversed(rows[first:first + 8]):
+            bits = (bits << width) | row
+        chunks.append(bits.to_bytes(width, 'little'))
+    return b''.join(chunks)[:size_in_bytes(width, len(rows))]
+
+
+def split_rows(data: bytes, width: int, height: int) -> List[int]:
+    """Returns the rows of the world in the canonical form (the reverse of `join_rows`)"""
+
+    mask = (1 << width) - 1
+    rows = []
+    for first in range(0, height, 8):
+        # each 8 rows are aligned with the bytes
+        bits = int.from_bytes(data[(first * width) >> 3:((first + 8) * width) >> 3], 'little')
+        for _ in range(min(height - first, 8)):
+            rows.append(bits & mask)
+            bits >>= width
+    return rows
+
+
+def crop_bits(data: bytes, width: int, x: int, y: int, crop_width: int, crop_height: int) -> bytes:
+    """Returns the rectangle of the world in the canonical form (also in the canonical form)"""
+
+    mask = (1 << crop_width) - 1
+    rows = []
+    for start in range(y * width + x, (y + crop_height) * width + x, width):
+        bits = int.from_bytes(data[start >> 3:((start + crop_width + 7) >> 3) + 1], 'little')
+        rows.append((bits >> (start & 7)) & mask)
+
+    return join_rows(rows, crop_width)
+
+
+def downsample_bits(data: bytes, width: int, height: int, scale: int) -> bytes:
+    """
+    Returns the world in the canonical form reduced `scale` times: a cell is live if any cell of its `scale` x `scale`
+    square is live. The reduced world is `ceil(width / scale)` x `ceil(height / scale)`.
+    """
+
+    if scale == 1:
+        return data
+
+    out_width = -(-width // scale)
+    padded_width = out_width * scale
+    cells = spread_bits(data, 8)
+
+    # The cells of a square are OR-ed as the bytes of big integers: `scale` columns of each row of the square
+    out_cells = []
+    for top in range(0, height, scale):
+        bits = 0
+        for start in range(top * width, min(top + scale, height) * width, width):
+            row = cells[start:start + width].ljust(padded_width, b'\x00')
+            for col in range(scale):
+                bits |= int.from_bytes(row[col::scale], 'little')
+        out_cells.append(bits.to_bytes(out_width, 'little'))
+
+    out_cells = b''.join(out_cells)
+    return compact_bits(out_cells + bytes(-len(out_cells) % 8), 8)
+
+
+def interleave_bits(data0: bytes, data1: bytes) -> bytes:
+    """Returns the bits of the data placed in pairs: the bit of `data0` and then the bit of `data1`"""
+
+    size = len(data0) << 1
+    bits = int.from_bytes(spread_bits(data0, 2), 'little') | (int.from_bytes(spread_bits(data1, 2), 'little') << 1)
+    return bits.to_bytes(size, 'little')
+
+
+def array_to_bytes(array_) -> bytes:
+    """Returns the array of integers as little-endian bytes"""
+
+    if sys.byteorder != 'little':
+        array_ = array(array_.typecode, array_)
+        array_.byteswap()
+    return array_.tobytes()
+
+
+def array_from_bytes(typecode: str, data: bytes) -> array:
+    """Create new array of integers from little-endian bytes"""
+
+    array_ = array(typecode)
+    array_.frombytes(data)
+    if sys.byteorder != 'little':
+        array_.byteswap()
+    return array_
+
+
+def bitarray_to_bytes(array_, size: int) -> bytes:
+    """Returns the first `size` bytes of the bitarray (see `util.bitarray`, 32 bits per item)"""
+
+    return array_to_bytes(array('I', array_))[:size]
+
+
+def bitarray_from_bytes(data: bytes) -> array:
+    """Create new bitarray (see `util.bitarray`, 32 bits per item) from the bytes"""
+
+    return array('L', array_from_bytes('I', data + bytes(-len(data) % 4)))
@@ -0,0 +1,220 @@
+from collections import OrderedDict
+
+from world.canonical import size_in_bytes
+from world.rules import CONWAY, Rule
+
+
+class Node:
+    """
+    Square of the plane with the side 2^level. Nodes are immutable and canonical (as long as they are in the cache
+    of the `HashLife`), so two equal squares are represented by the same node.
+    """
+
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population', 'next')
+
+    def __init__(self, level: int, nw=None, ne=None, sw=None, se=None, population: int = 0):
+        self.level = level
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.population = population
+        self.next = None  # the centers of the node advanced by 2^j generations, {j: node}
+
+
+class HashLife:
+    """
+    HashLife algorithm to advance the world by many generations at once.
+
+    https://en.wikipedia.org/wiki/Hashlife
+
+    The world is a torus, so we tile the plane with copies of the world. Each copy evolves in the same way,
+    so the center of the tiled square advanced by 2^j generations contains the world advanced by 2^j generations.
+    """
+
+    def __init__(self, width: int, height: int, max_nodes: int = 1 << 18, rule: Rule = CONWAY):
+        self._width = width
+        self._height = height
+        self._rule = rule
+        self._row_mask = (1 << width) - 1
+
+        # The cache of canonical nodes. When the cache is full, we evict the least recently used nodes. An evicted
+        # node still works, but it loses its memoized results for new equal squares.
+        self._nodes = OrderedDict()
+        self._max_nodes = max_nodes
+
+        self._dead = Node(0)
+        self._live = Node(0, population=1)
+
+        # The level of the smallest node whose center contains the whole world
+        self._min_level = max(2, (max(width, height) - 1).bit_length() + 1)
+
+    @property
+    def cache_size(self) -> int:
+        return len(self._nodes)
+
+    def advance(self, data: bytes, generations: int) -> bytes:
+        """Advance the world in the canonical form (see `world.canonical`) by the number of generations"""
+
+        if generations < 0:
+            raise ValueError(f"`generations` must be positive number, got {generations}")
+
+        rows = self._unpack(data)
+
+        j = 0
+        while generations:
+            if generations & 1:
+                rows = self._jump(rows, j)
+            generations >>= 1
+            j += 1
+
+        return self._pack(rows)
+
+    def _unpack(self, data: bytes):
+        width, mask = self._width, self._row_mask
+        bits = int.from_bytes(data, 'little')
+        return [(bits >> (row * width)) & mask for row in range(self._height)]
+
+    def _pack(self, rows) -> bytes:
+        width = self._width
+        bits = 0
+        for row in reversed(rows):
+            bits = (bits << width) | row
+
+        return bits.to_bytes(size_in_bytes(width, self._height), 'little')
+
+    def _jump(self, rows, j: int):
+        """Advance the world by 2^j generations"""
+
+        level = max(self._min_level, j + 2)
+        quarter = 1 << (level - 2)
+
+        root = self._tile(rows, level, -quarter, -quarter, {})
+        result = self._successor(root, j)
+
+        new_rows = [0] * self._height
+        self._write(result, 0, 0, new_rows)
+        return new_rows
+
+    def _tile(self, rows, level: int, x: int, y: int, memo: dict) -> Node:
+        """Returns a node of the plane tiled with the world"""
+
+        x %= self._width
+        y %= self._height
+
+        key = (level, x, y)
+        node = memo.get(key)
+
+        if node is None:
+            if level == 0:
+                node = self._live if (rows[y] >> x) & 1 else self._dead
+            else:
+                half = 1 << (level - 1)
+                node = self._join(self._tile(rows, level - 1, x, y, memo),
+                                  self._tile(rows, level - 1, x + half, y, memo),
+                                  self._tile(rows, level - 1, x, y + half, memo),
+                                  self._tile(rows, level - 1, x + half, y + half, memo))
+            memo[key] = node
+
+        return node
+
+    def _write(self, node: Node, x: int, y: int, rows) -> None:
+        """Write the cells of the node that fall into the world"""
+
+        if node.population == 0 or x >= self._width or y >= self._height:
+            return
+
+        if node.level == 0:
+            rows[y] |= 1 << x
+        else:
+            half = 1 << (node.level - 1)
+            self._write(node.nw, x, y, rows)
+            self._write(node.ne, x + half, y, rows)
+            self._write(node.sw, x, y + half, rows)
+            self._write(node.se, x + half, y + half, rows)
+
+    def _join(self, nw: Node, ne: Node, sw: Node, se: Node) -> Node:
+        key = (nw, ne, sw, se)
+        node = self._nodes.get(key)
+
+        if node is None:
+            population = nw.population + ne.population + sw.population + se.population
+            self._nodes[key] = node = Node(nw.level + 1, nw, ne, sw, se, population)
+            if len(self._nodes) > self._max_nodes:
+                self._nodes.popitem(last=False)
+        else:
+            self._nodes.move_to_end(key)
+
+        return node
+
+    def _center(self, node: Node) -> Node:
+        return self._join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def _successor(self, node: Node, j: int) -> Node:
+        """Returns the center of the node advanced by 2^j generations (j <= level - 2)"""
+
+        if node.next is None:
+            node.next = {}
+        else:
+            result = node.next.get(j)
+            if result is not None:
+                return result
+
+        if node.population == 0:
+            result = node.nw
+        elif node.level == 2:
+            result = self._life_4x4(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+
+            # Nine overlapping subnodes of the level - 1
+            #
+            #  n00 | n01 | n02
+            # -----+-----+-----
+            #  n10 | n11 | n12
+            # -----+-----+-----
+            #  n20 | n21 | n22
+
+            nine = (
+                nw, self._join(nw.ne, ne.nw, nw.se, ne.sw), ne,
+                self._join(nw.sw, nw.se, sw.nw, sw.ne), self._join(nw.se, ne.sw, sw.ne, se.nw),
+                self._join(ne.sw, ne.se, se.nw, se.ne),
+                sw, self._join(sw.ne, se.nw, sw.se, se.sw), se,
+            )
+
+            if j == node.level - 2:
+                # Advance the nine subnodes by 2^(level - 3) generations, and then the four combined ones again
+                step = j - 1
+                n00, n01, n02, n10, n11, n12, n20, n21, n22 = (self._successor(n, step) for n in nine)
+            else:
+                # Take the centers of the nine subnodes, and then advance the four combined ones by 2^j generations
+                step = j
+                n00, n01, n02, n10, n11, n12, n20, n21, n22 = (self._center(n) for n in nine)
+
+            result = self._join(self._successor(self._join(n00, n01, n10, n11), step),
+                                self._successor(self._join(n01, n02, n11, n12), step),
+                                self._successor(self._join(n10, n11, n20, n21), step),
+                                self._successor(self._join(n11, n12, n21, n22), step))
+
+        node.next[j] = result
+        return result
+
+    def _life_4x4(self, node: Node) -> Node:
+        """Returns the center 2x2 of the 4x4 node advanced by one generation"""
+
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        cells = (
+            (nw.nw.population, nw.ne.population, ne.nw.population, ne.ne.population),
+            (nw.sw.population, nw.se.population, ne.sw.population, ne.se.population),
+            (sw.nw.population, sw.ne.population, se.nw.population, se.ne.population),
+            (sw.sw.population, sw.se.population, se.sw.population, se.se.population),
+        )
+
+        birth, survival = self._rule
+
+        def next_cell(row, col):
+            neighbours = (cells[row - 1][col - 1] + cells[row - 1][col] + cells[row - 1][col + 1] +
+                          cells[row][col - 1] + cells[row][col + 1] +
+                          cells[row + 1][col - 1] + cells[row + 1][col] + cells[row + 1][col + 1])
+            if neighbours in (survival if cells[row][col] else birth):
+                return self._live
+            return self._dead
+
+        return self._join(next_cell(1, 1), next_cell(1, 2), next_cell(2, 1), next_cell(2, 2))
@@ -0,0 +1,222 @@
+import re
+from bisect import bisect
+from struct import Struct
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# A delta is a sequence of records: offset, length and the nonzero bytes of the XOR of two worlds
+_RECORD_HEADER = Struct('<II')
+
+# Nonzero bytes. Short gaps of zero bytes are cheaper to keep than to start a new record.
+_NONZERO_BYTES = re.compile(rb'[^\x00]+(?:\x00{1,8}[^\x00]+)*')
+
+
+def xor_bytes(data1: bytes, data2: bytes) -> bytes:
+    return (int.from_bytes(data1, 'little') ^ int.from_bytes(data2, 'little')).to_bytes(len(data1), 'little')
+
+
+def encode_delta(prev_data: bytes, data: bytes, alignment: int = 1) -> bytes:
+    """
+    Returns the XOR of two worlds (as bytes), run-length encoded.
+    The offsets and lengths of the records are multiples of the `alignment`.
+    """
+
+    diff = xor_bytes(prev_data, data)
+    if alignment == 1:
+        return b''.join(_RECORD_HEADER.pack(m.start(), m.end() - m.start()) + m.group()
+                        for m in _NONZERO_BYTES.finditer(diff))
+
+    runs = ((m.start() - m.start() % alignment, m.end() + -m.end() % alignment) for m in _NONZERO_BYTES.finditer(diff))
+    return b''.join(_RECORD_HEADER.pack(start, end - start) + diff[start:end] for start, end in runs)
+
+
+def apply_delta(prev_data: bytes, delta: bytes) -> bytes:
+    """Returns the world (as bytes) restored from the previous world and the delta"""
+
+    data = bytearray(prev_data)
+
+    pos = 0
+    while pos < len(delta):
+        offset, length = _RECORD_HEADER.unpack_from(delta, pos)
+        pos += _RECORD_HEADER.size
+        data[offset:offset + length] = xor_bytes(data[offset:offset + length], delta[pos:pos + length])
+        pos += length
+
+    return bytes(data)
+
+
+class WorldHistory:
+    """
+    Worlds of the game (as bytes) by serial.
+
+    Every `keyframe_interval`-th world is kept as is (keyframe), the others as deltas from the previous world.
+    If the history exceeds the `budget` (in bytes), we drop the oldest deltas (and then the keyframes, while they are
+    not too far apart), and recalculate the dropped worlds from the nearest keyframe with the `step` function when they
+    are needed. If it's not enough, the oldest worlds are removed from the history (the game recalculates them).
+
+    Origins are the worlds that can't be calculated from the previous ones (the first world of the game, the first
+    world after a gap). They are always kept as keyframes.
+    """
+
+    # Approximate size of a dict entry and a bytes object header
+    _ENTRY_OVERHEAD = 100
+
+    # The keyframes are dropped while the remaining ones are not farther apart than so many keyframe intervals
+    _MAX_KEYFRAME_SPACING = 4
+
+    def __init__(self, step: Callable[[bytes], bytes], keyframe_interval: int = 64, budget: int = 16 << 20):
+        self._step = step
+        self._keyframe_interval = keyframe_interval
+        self._budget = budget
+
+        self._keyframes: Dict[int, bytes] = {}
+        self._deltas: Dict[int, bytes] = {}
+        self._size = 0
+
+        self._origins: Set[int] = set()
+
+        # Sorted [first, last] serials of the stored worlds without gaps. The first world of a run is an origin.
+        self._runs: List[List[int]] = []
+
+        self._last_serial: Optional[int] = None  # the last added world
+        self._cursor: Optional[Tuple[int, bytes]] = None  # the last added or restored world
+
+    @property
+    def size(self) -> int:
+        """Approximate size of the history in bytes"""
+        return self._size
+
+    @property
+    def count(self) -> int:
+        """Number of the stored worlds"""
+        return len(self._keyframes) + len(self._deltas)
+
+    def find_run(self, serial: int) -> Optional[Tuple[int, int]]:
+        """Returns the (first, last) serials of the nearest run of stored worlds that starts before the serial"""
+
+        i = bisect(self._runs, [serial])
+        return tuple(self._runs[i - 1]) if i else None
+
+    def __contains__(self, serial: int) -> bool:
+        run = self.find_run(serial + 1)
+        return run is not None and serial <= run[1]
+
+    def add(self, serial: int, data: bytes, origin: bool = False) -> None:
+        if serial in self:
+            raise ValueError(f"World {serial} is already in the history")
+
+        i = bisect(self._runs, [serial])
+        run = self._runs[i - 1] if i and self._runs[i - 1][1] == serial - 1 else None
+
+        if run is None:
+            origin = True
+
+        if origin or serial % self._keyframe_interval == 0:
+            if origin:
+                self._origins.add(serial)
+            self._keyframes[serial] = data
+            self._size += len(data) + self._ENTRY_OVERHEAD
+        else:
+            delta = encode_delta(self.get(serial - 1), data)
+            self._deltas[serial] = delta
+            self._size += len(delta) + self._ENTRY_OVERHEAD
+
+        if run is None:
+            run = [serial, serial]
+            self._runs.insert(i, run)
+            i += 1
+        else:
+            run[1] = serial
+
+        # join with the next run
+        if i < len(self._runs) and self._runs[i][0] == serial + 1:
+            run[1] = self._runs.pop(i)[1]
+
+        self._last_serial = serial
+        self._cursor = (serial, data)
+        self._fit_budget()
+
+    def get(self, serial: int) -> bytes:
+        cursor = self._cursor
+        if cursor is not None and cursor[0] == serial:
+            return cursor[1]
+
+        if serial not in self:
+            raise KeyError(serial)
+
+        # The first world of a run is an origin (keyframe), so we always find a keyframe
+        first = serial
+        while first not in self._keyframes:
+            first -= 1
+
+        # Sequential access: continue from the cursor if it's closer
+        if cursor is not None and first < cursor[0] < serial:
+            first, data = cursor
+        else:
+            data = self._keyframes[first]
+
+        for next_serial in range(first + 1, serial + 1):
+            delta = self._deltas.get(next_serial)
+            data = self._step(data) if delta is None else apply_delta(data, delta)
+
+        self._cursor = (serial, data)
+        return data
+
+    def _fit_budget(self) -> None:
+        if self._size <= self._budget:
+            return
+
+        # The latest keyframe and its deltas are needed to continue the game, so we keep them
+        latest = self._last_serial
+        while latest not in self._keyframes:
+            latest -= 1
+
+        # Drop the oldest deltas...
+        for serial in list(self._deltas):
+            if self._size <= self._budget:
+                return
+            if not latest < serial <= self._last_serial:
+                self._size -= len(self._deltas.pop(serial)) + self._ENTRY_OVERHEAD
+
+        # ... then the keyframes, except the origins, while a dropped world is recalculated from a keyframe not farther
+        # than the limit...
+        max_spacing = self._keyframe_interval * self._MAX_KEYFRAME_SPACING
+        serials = sorted(self._keyframes)
+        prev_serial = None
+        for serial, next_serial in zip(serials, serials[1:]):
+            if self._size <= self._budget:
+                return
+            if (serial not in self._origins and serial < latest and prev_serial is not None and
+                    next_serial - prev_serial <= max_spacing):
+                self._size -= len(self._keyframes.pop(serial)) + self._ENTRY_OVERHEAD
+            else:
+                prev_serial = serial
+
+        # ... and then the oldest worlds, from a keyframe to the next one
+        while self._size > self._budget:
+            serial = next((serial for serial in sorted(self._keyframes) if serial not in self._origins), latest)
+            if serial >= latest:
+                break
+            self._remove_worlds(serial)
+
+    def _remove_worlds(self, first: int) -> None:
+        """Remove the worlds from the keyframe to the next keyframe, the next keyframe becomes an origin of a run"""
+
+        i = bisect(self._runs, [first]) - 1
+        run = self._runs[i]
+        next_keyframe = min(serial for serial in self._keyframes if serial > first)
+        last = min(next_keyframe - 1, run[1])
+
+        self._size -= len(self._keyframes.pop(first)) + self._ENTRY_OVERHEAD
+        for serial in range(first + 1, last + 1):
+            delta = self._deltas.pop(serial, None)
+            if delta is not None:
+                self._size -= len(delta) + self._ENTRY_OVERHEAD
+
+        # the first world of a run is an origin, so the run keeps the worlds before the removed ones
+        if last < run[1]:
+            self._origins.add(last + 1)
+            self._runs.insert(i + 1, [last + 1, run[1]])
+        run[1] = first - 1
+
+        if self._cursor is not None and first <= self._cursor[0] <= last:
+            self._cursor = None
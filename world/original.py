@@ -1,6 +1,8 @@
+from itertools import chain
 from random import randint
 
 from world import AbstractWorldFactory
+from world.canonical import compact_bits, spread_bits
 
 
 class WorldFactory(AbstractWorldFactory):
@@ -28,18 +30,28 @@ class WorldFactory(AbstractWorldFactory):
             for j in range(len(universe[0])):
 
                 if universe[i][j]:
-                    if self.__get_near(universe, [i, j]) not in (2, 3):
+                    if self.__get_near(universe, [i, j]) not in self._rule.survival:
                         new_world[i][j] = 0
                         continue
                     new_world[i][j] = 1
                     continue
 
-                if self.__get_near(universe, [i, j]) == 3:
+                if self.__get_near(universe, [i, j]) in self._rule.birth:
                     new_world[i][j] = 1
                     continue
                 new_world[i][j] = 0
         return new_world
 
+    def world_to_bytes(self, world) -> bytes:
+        # one byte per cell, padded to whole bytes of the canonical form
+        cells = bytes(chain.from_iterable(world))
+        return compact_bits(cells + bytes(-len(cells) % 8), 8)
+
+    def world_from_bytes(self, data: bytes):
+        width = self._width
+        cells = spread_bits(data, 8)
+        return [list(cells[row:row + width]) for row in range(0, width * self._height, width)]
+
     @staticmethod
     def __get_near(universe, pos, system=None):
         if system is None:
@@ -0,0 +1,223 @@
+"""
+Import and export of the standard Life patterns: RLE (`.rle`) and plaintext (`.cells`).
+
+https://conwaylife.com/wiki/Run_Length_Encoded
+https://conwaylife.com/wiki/Plaintext
+
+The patterns are converted from/to the canonical form of the world (see `world.canonical`) as a whole, through the
+cells (a byte per cell, row-major), with the string methods instead of a loop over the cells.
+"""
+
+import re
+import string
+from typing import Optional, Tuple, List
+
+from world.canonical import compact_bits, spread_bits
+from world.rules import CONWAY, Rule, RuleError, parse_rule
+
+# The largest pattern (and world created from it) in cells
+MAX_PATTERN_CELLS = 1 << 24
+
+_DEAD = '\x00'
+_LIVE = '\x01'
+
+# RLE: the header and a run (count and tag)
+_RLE_HEADER = re.compile(r'x\s*=\s*(\d+)\s*,\s*y\s*=\s*(\d+)(?:\s*,\s*rule\s*=\s*(\S+))?\s*$', re.IGNORECASE)
+_RLE_RUN = re.compile(r'(\d+)(\D)')
+_RLE_INVALID = re.compile(r'[^0-9b.$A-Za-z]')
+
+# "b" and "." are dead cells, the other letters are live cells (the states of the multi-state rules)
+_RLE_CELLS = str.maketrans({**{c: _LIVE for c in string.ascii_letters}, 'b': _DEAD, '.': _DEAD})
+
+# The tokens of the exported RLE: a run of cells or rows
+_RLE_TOKEN = re.compile(r'\d*[bo$]')
+_RLE_LINE_LENGTH = 70
+
+_PLAINTEXT_INVALID = re.compile(r'[^.Oo*]')
+_PLAINTEXT_CELLS = str.maketrans({'.': _DEAD, 'O': _LIVE, 'o': _LIVE, '*': _LIVE})
+
+
+class PatternError(ValueError):
+    pass
+
+
+def parse_pattern(text: str) -> Tuple[int, int, bytes, Optional[Rule]]:
+    """
+    Returns (width, height, world in the canonical form, rule) of the RLE or plaintext pattern. The rule is None if
+    the pattern doesn't specify it.
+    """
+
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith(('#', '!')):
+            break
+    else:
+        raise PatternError("The pattern is empty")
+
+    if _RLE_HEADER.match(line):
+        return parse_rle(text)
+    else:
+        return (*parse_plaintext(text), None)
+
+
+def parse_rle(text: str) -> Tuple[int, int, bytes, Optional[Rule]]:
+    """Returns (width, height, world in the canonical form, rule or None) of the RLE pattern"""
+
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line and not line.startswith('#')]
+    if not lines:
+        raise PatternError("The pattern is empty")
+
+    header = _RLE_HEADER.match(lines[0])
+    if header is None:
+        raise PatternError(f"Invalid RLE header: {lines[0]!r}")
+
+    width, height = int(header[1]), int(header[2])
+    _check_size(width, height)
+
+    rule = header[3]
+    if rule is not None:
+        try:
+            rule = parse_rule(rule)
+        except RuleError as e:
+            raise PatternError(f"The rule is not supported: {e}") from e
+
+    data = ''.join(lines[1:])
+    end = data.find('!')
+    if end >= 0:
+        data = data[:end]
+    data = ''.join(data.split())
+
+    invalid = _RLE_INVALID.search(data)
+    if invalid is not None:
+        raise PatternError(f"Invalid RLE tag {invalid[0]!r}")
+
+    def expand_run(match) -> str:
+        count, tag = int(match[1]), match[2]
+        if count > (height if tag == '$' else width):
+            raise PatternError(f"The run {match[0]!r} is out of the pattern")
+        return tag * count
+
+    # a count is always followed by a tag, except at the end of the data
+    data = _RLE_RUN.sub(expand_run, data)
+    count = data[len(data.rstrip(string.digits)):]
+    if count:
+        raise PatternError(f"The RLE count {count!r} has no tag")
+
+    rows = data.split('$')
+    if len(rows) > height:
+        # the trailing empty rows are allowed
+        if any(rows[height:]):
+            raise PatternError(f"The pattern has more than {height} rows")
+        del rows[height:]
+
+    return width, height, _cells_to_bytes(_rows_to_cells(rows, width, height, _RLE_CELLS)), rule
+
+
+def parse_plaintext(text: str) -> Tuple[int, int, bytes]:
+    """Returns (width, height, world in the canonical form) of the plaintext pattern"""
+
+    rows = [line.rstrip() for line in text.splitlines() if not line.startswith('!')]
+    while rows and not rows[-1]:
+        rows.pop()
+    if not rows:
+        raise PatternError("The pattern is empty")
+
+    for row in rows:
+        invalid = _PLAINTEXT_INVALID.search(row)
+        if invalid is not None:
+            raise PatternError(f"Invalid plaintext cell {invalid[0]!r}")
+
+    width, height = max(map(len, rows)), len(rows)
+    _check_size(width, height)
+
+    return width, height, _cells_to_bytes(_rows_to_cells(rows, width, height, _PLAINTEXT_CELLS))
+
+
+def place_pattern(width: int, height: int, data: bytes, world_width: int, world_height: int) -> bytes:
+    """Returns the world in the canonical form with the pattern (in the canonical form) in its center"""
+
+    if width > world_width or height > world_height:
+        raise PatternError(f"The pattern {width}x{height} is larger than the world {world_width}x{world_height}")
+    if (width, height) == (world_width, world_height):
+        return data
+
+    cells = _cells_from_bytes(data, width * height)
+    world_cells = bytearray(world_width * world_height)
+
+    start = (world_height - height) // 2 * world_width + (world_width - width) // 2
+    for row in range(height):
+        offset = start + row * world_width
+        world_cells[offset:offset + width] = cells[row * width:(row + 1) * width]
+
+    return _cells_to_bytes(bytes(world_cells))
+
+
+def format_rle(width: int, height: int, data: bytes, comment: Optional[str] = None, rule: Rule = CONWAY) -> str:
+    """Returns the RLE pattern of the world in the canonical form"""
+
+    rows = [row.rstrip('b') for row in _cells_to_rows(data, width, height, 'bo')]
+
+    # the empty rows are the runs of "$"
+    body = re.sub(r'(.)\1+', lambda match: f'{len(match[0])}{match[1]}', '$'.join(rows).rstrip('$'))
+
+    lines = [f'#C {comment}'] if comment else []
+    lines.append(f'x = {width}, y = {height}, rule = {rule}')
+
+    line = ''
+    for token in _RLE_TOKEN.findall(body):
+        if len(line) + len(token) > _RLE_LINE_LENGTH:
+            lines.append(line)
+            line = ''
+        line += token
+    lines.append(line + '!')
+
+    return '\n'.join(lines) + '\n'
+
+
+def format_plaintext(width: int, height: int, data: bytes, comment: Optional[str] = None, rule: Rule = CONWAY) -> str:
+    """Returns the plaintext pattern of the world in the canonical form (the format has no rule)"""
+
+    lines = [f'!{comment}'] if comment else []
+    lines.extend(_cells_to_rows(data, width, height, '.O'))
+    return '\n'.join(lines) + '\n'
+
+
+# The exporters by the file extensions of the formats
+PATTERN_FORMATS = {
+    'rle': format_rle,
+    'cells': format_plaintext,
+}
+
+
+def _check_size(width: int, height: int) -> None:
+    if width < 1 or height < 1:
+        raise PatternError(f"Invalid size of the pattern {width}x{height}")
+    if width * height > MAX_PATTERN_CELLS:
+        raise PatternError(f"The pattern {width}x{height} is larger than {MAX_PATTERN_CELLS} cells")
+
+
+def _rows_to_cells(rows: List[str], width: int, height: int, table: dict) -> bytes:
+    """Returns the cells (a byte per cell) of the rows of tags translated by the table"""
+
+    for row in rows:
+        if len(row) > width:
+            raise PatternError(f"The pattern has more than {width} columns")
+
+    cells = ''.join(row.translate(table).ljust(width, _DEAD) for row in rows)
+    return cells.encode('latin-1').ljust(width * height, b'\x00')
+
+
+def _cells_to_rows(data: bytes, width: int, height: int, tags: str) -> List[str]:
+    """Returns the rows of the world in the canonical form as the strings of the tags of the dead and live cells"""
+
+    cells = _cells_from_bytes(data, width * height).translate(bytes.maketrans(b'\x00\x01', tags.encode())).decode()
+    return [cells[start:start + width] for start in range(0, width * height, width)]
+
+
+def _cells_to_bytes(cells: bytes) -> bytes:
+    return compact_bits(cells + bytes(-len(cells) % 8), 8)
+
+
+def _cells_from_bytes(data: bytes, size: int) -> bytes:
+    return spread_bits(data, 8)[:size]
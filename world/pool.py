@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Optional
+
+from world import AbstractWorldFactory
+from world.rules import Rule
+
+# Number of processes to calculate the worlds (0 - calculate in the calling thread)
+_PROCESSES = int(os.environ.get('STEP_PROCESSES', 0))
+
+# For smaller worlds, sending the world to another process takes longer than calculating it here
+_MIN_CELLS = int(os.environ.get('STEP_PROCESSES_MIN_CELLS', 64 * 64))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = Lock()
+
+# Factories of a worker process, {(class, width, height, rule): factory}
+_factories = {}
+
+
+def create_next_world(factory: AbstractWorldFactory, world):
+    """
+    Create new world based on the existing world. Big enough worlds are calculated in the process pool, so the
+    sessions are not limited to one core by the GIL. The calling thread waits for the result.
+    """
+
+    if not _PROCESSES or factory.width * factory.height < _MIN_CELLS:
+        return factory.create_next_world(world)
+
+    future = _get_executor().submit(
+        _create_next_world, type(factory), factory.width, factory.height, factory.rule, factory.world_to_bytes(world))
+
+    return factory.world_from_bytes(future.result())
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            # The workers are spawned (not forked), because the web server has threads
+            _executor = ProcessPoolExecutor(_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _create_next_world(factory_class, width: int, height: int, rule: Rule, data: bytes) -> bytes:
+    """Runs in a worker process"""
+
+    key = (factory_class, width, height, rule)
+    factory = _factories.get(key)
+    if factory is None:
+        _factories[key] = factory = factory_class(width, height, rule)
+
+    return factory.world_to_bytes(factory.create_next_world(factory.world_from_bytes(data)))
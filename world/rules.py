@@ -0,0 +1,187 @@
+"""
+Life-like rules (outer totalistic rules of the Moore neighbourhood) in the B/S notation: "B3/S23" - a dead cell with
+3 live neighbours is born, a live cell with 2 or 3 live neighbours survives, all other cells are dead.
+
+https://conwaylife.com/wiki/Rulestring
+
+The packed engines (see `world.world64`) calculate 16 cells of a record at once with bitwise operations. For a rule we
+derive the bitwise expression of the next state of the cells (see `bitwise_expression`) and compile it into the loop
+of the engine (see `compile_kernel`), so any rule runs as fast as the hand-written expression of Conway's Life.
+"""
+
+import re
+import textwrap
+from functools import lru_cache
+from typing import Callable, FrozenSet, List, NamedTuple, Tuple
+
+# The rulestring: B3/S23 (or S23/B3) and the old notation S/B: 23/3
+_BS_RULE = re.compile(r'b([0-8]*)/s([0-8]*)$', re.IGNORECASE)
+_SB_RULE = re.compile(r's([0-8]*)/b([0-8]*)$', re.IGNORECASE)
+_OLD_RULE = re.compile(r'([0-8]*)/([0-8]*)$')
+
+# The totals of the 3x3 square (the cell and its neighbours) are in 4 bits: 0..9
+_TOTAL_BITS = 4
+_MAX_TOTAL = 9
+
+
+class RuleError(ValueError):
+    pass
+
+
+class Rule(NamedTuple):
+    birth: FrozenSet[int]  # the numbers of the live neighbours of a dead cell to become live
+    survival: FrozenSet[int]  # the numbers of the live neighbours of a live cell to stay live
+
+    def __str__(self):
+        return f"B{''.join(map(str, sorted(self.birth)))}/S{''.join(map(str, sorted(self.survival)))}"
+
+
+# Conway's Life
+CONWAY = Rule(frozenset((3,)), frozenset((2, 3)))
+
+# The well-known Life-like rules
+KNOWN_RULES = {
+    'B3/S23': "Conway's Life",
+    'B36/S23': "HighLife",
+    'B3678/S34678': "Day & Night",
+    'B2/S': "Seeds",
+    'B3/S012345678': "Life without Death",
+    'B368/S245': "Morley",
+    'B1357/S1357': "Replicator",
+}
+
+
+def parse_rule(text: str) -> Rule:
+    """Returns the rule of the rulestring (B3/S23, S23/B3 or 23/3). Raises `RuleError` if it's not a Life-like rule."""
+
+    text = text.strip()
+
+    match = _BS_RULE.match(text)
+    if match is not None:
+        birth, survival = match[1], match[2]
+    else:
+        match = _SB_RULE.match(text) or _OLD_RULE.match(text)
+        if match is None:
+            raise RuleError(f"Invalid rule {text!r}, expected B<digits>/S<digits>")
+        survival, birth = match[1], match[2]
+
+    if '0' in birth:
+        # the empty space would come alive, but HashLife and the end of the game rely on the empty space staying empty
+        raise RuleError(f"The rules with B0 are not supported: {text!r}")
+
+    return Rule(frozenset(map(int, birth)), frozenset(map(int, survival)))
+
+
+def bitwise_expression(rule: Rule) -> Tuple[str, str]:
+    """
+    Returns the statement and the expression that calculate the next state of the cells of a record. The variables:
+        cell - the record of the cells (the lowest bit of each cell)
+        x0   - the totals of the 3x3 squares of the cells, 4 bits per cell
+    The statement assigns x1, x2, x3 - the totals shifted by 1, 2, 3 bits, which the expression uses. The lowest bit of
+    each cell in the result of the expression is the next state of the cell, the other bits are garbage.
+
+    For B3/S23 it's: cell & x2 & ~x1 & ~x0 | ~x2 & x1 & x0
+    """
+
+    # The total includes the cell itself: a live cell with N neighbours has the total N + 1
+    on = [_minterm(0, total) for total in rule.birth]
+    on += [_minterm(1, total + 1) for total in rule.survival]
+
+    # The totals over 9 are impossible, as a live cell without the total 0
+    dont_care = [_minterm(live, total) for live in (0, 1) for total in range(_MAX_TOTAL + 1, 1 << _TOTAL_BITS)]
+    dont_care.append(_minterm(1, 0))
+
+    terms = _minimize(on, dont_care)
+
+    names = ['cell'] + [f'x{bit}' for bit in reversed(range(_TOTAL_BITS))]
+    products = []
+    for value, mask in terms:
+        literals = [name if (value >> position) & 1 else f'~{name}'
+                    for position, name in zip(reversed(range(len(names))), names) if (mask >> position) & 1]
+        products.append(' & '.join(literals) or '-1')
+
+    expression = ' | '.join(products) or '0'
+
+    shifts = [f'x{bit} = x0 >> {bit}' for bit in range(1, _TOTAL_BITS) if re.search(rf'\bx{bit}\b', expression)]
+    return '; '.join(shifts) or 'pass', expression
+
+
+@lru_cache(maxsize=None)
+def compile_kernel(source: str, name: str, rule: Rule) -> Callable:
+    """
+    Returns the function `name` defined by the source, where {shifts} and {expression} are replaced by the statement
+    and the expression of the rule (see `bitwise_expression`). The functions are compiled once per rule.
+    """
+
+    shifts, expression = bitwise_expression(rule)
+    namespace = {}
+    exec(compile(source.format(shifts=shifts, expression=expression), f'<{name} {rule}>', 'exec'), namespace)
+    return namespace[name]
+
+
+def insert_code(template: str, **blocks: str) -> str:
+    """
+    Returns the template of a kernel with the blocks of code in place of the placeholders `{name}` that take a whole
+    line, indented as the placeholders. The other placeholders (of the rule) are left for `compile_kernel`.
+    """
+
+    def insert(match) -> str:
+        block = blocks.get(match[2])
+        return match[0] if block is None else textwrap.indent(textwrap.dedent(block).strip('\n'), match[1])
+
+    return re.sub(r'^( *)\{(\w+)\}$', insert, template, flags=re.MULTILINE)
+
+
+def _minterm(live: int, total: int) -> int:
+    return (live << _TOTAL_BITS) | total
+
+
+def _minimize(on: List[int], dont_care: List[int]) -> List[Tuple[int, int]]:
+    """
+    Returns the products (value, mask of the used variables) whose sum covers the minterms `on`, using the minterms
+    `dont_care` as well (Quine-McCluskey). The variables are 5 bits: the cell and 4 bits of the total.
+    """
+
+    full_mask = (1 << (_TOTAL_BITS + 1)) - 1
+    if not on:
+        return []
+
+    # Combine the products that differ in one variable, until nothing can be combined. The products that aren't
+    # combined are the prime implicants.
+    products = set((minterm, full_mask) for minterm in set(on) | set(dont_care))
+    primes = set()
+    while products:
+        combined = set()
+        used = set()
+        for value, mask in products:
+            for bit in range(_TOTAL_BITS + 1):
+                flag = 1 << bit
+                if mask & flag and not value & flag:
+                    other = (value | flag, mask)
+                    if other in products:
+                        combined.add((value, mask & ~flag))
+                        used.add((value, mask))
+                        used.add(other)
+        primes |= products - used
+        products = combined
+
+    # Cover the minterms: first the essential prime implicants, then greedily the ones covering the most minterms
+    # with the fewest literals (and without the highest bit of the total, to save a shift)
+    def covers(prime: Tuple[int, int], minterm: int) -> bool:
+        value, mask = prime
+        return minterm & mask == value & mask
+
+    def rank(prime: Tuple[int, int]) -> tuple:
+        return sum(covers(prime, minterm) for minterm in uncovered), -bin(prime[1]).count('1'), -(prime[1] >> 3 & 1)
+
+    uncovered = set(on)
+    cover = []
+    while uncovered:
+        essential = next((candidates[0] for candidates in
+                          ([prime for prime in primes if covers(prime, minterm)] for minterm in sorted(uncovered))
+                          if len(candidates) == 1), None)
+        prime = essential or max(sorted(primes), key=rank)
+        cover.append(prime)
+        uncovered = set(minterm for minterm in uncovered if not covers(prime, minterm))
+
+    return sorted(cover, key=lambda prime: (-prime[1], prime[0]))
@@ -0,0 +1,89 @@
+from array import array
+
+import numpy as np
+
+from world import AbstractWorldFactory
+from world.rules import CONWAY, Rule
+
+
+class WorldFactory(AbstractWorldFactory):
+
+    def __init__(self, width, height, rule: Rule = CONWAY):
+        super(WorldFactory, self).__init__(width, height, rule)
+
+        # The world is stored as a 2D array of uint8 (one byte per cell), so NumPy can calculate all cells at once.
+        self._shape = (height, width)
+        self._size = width * height
+
+        # To pack the worlds into an uint32 array (2 bit per cell), we shift the 16 cells of each record
+        # by their offsets and then sum them.
+        self._pack_offsets = np.arange(0, 32, 2, dtype=np.uint32)
+
+        # The totals of the 3x3 square (the cell and its neighbours) for which the cell is live in the next world: for
+        # any cell, only for a dead cell and only for a live cell. The square includes the cell itself, so a live cell
+        # with N neighbours has a total of N + 1.
+        birth, survival = set(rule.birth), set(neighbours + 1 for neighbours in rule.survival)
+        self._live_totals = sorted(birth & survival)
+        self._birth_totals = sorted(birth - survival)
+        self._survival_totals = sorted(survival - birth)
+
+    def is_live_cell(self, world, row: int, col: int) -> bool:
+        return int(world[row, col])
+
+    def revive_cell(self, world, row: int, col: int):
+        world[row, col] = 1
+
+    def kill_cell(self, world, row: int, col: int):
+        world[row, col] = 0
+
+    def create_empty_world(self):
+        return np.zeros(self._shape, dtype=np.uint8)
+
+    def create_random_world(self):
+        return np.random.randint(0, 2, self._shape, dtype=np.uint8)
+
+    def create_next_world(self, world):
+        """
+        1. Any live cell with a number of live neighbours in the survival list of the rule survives.
+        2. Any dead cell with a number of live neighbours in the birth list of the rule becomes a live cell.
+        3. All other live cells die in the next generation. Similarly, all other dead cells stay dead.
+
+        https://en.wikipedia.org/wiki/Conway%27s_Game_of_Life#Rules
+        """
+
+        # Let's sum the vertical neighbors for each 1x3 rectangle, and then horizontally sum the rectangles to get
+        # the number of live cells in each 3x3 square. `np.roll` wraps the edges, so the world remains a torus.
+        column = world + np.roll(world, 1, axis=0) + np.roll(world, -1, axis=0)
+        total = column + np.roll(column, 1, axis=1) + np.roll(column, -1, axis=1)
+
+        # For B3/S23: (total == 3) | (live & (total == 4))
+        live = world.astype(bool)
+        new_world = np.zeros(self._shape, dtype=bool)
+        for value in self._live_totals:
+            new_world |= total == value
+        if self._birth_totals:
+            dead = ~live
+            for value in self._birth_totals:
+                new_world |= (total == value) & dead
+        for value in self._survival_totals:
+            new_world |= (total == value) & live
+        return new_world.view(np.uint8)
+
+    def world_to_bytes(self, world) -> bytes:
+        return np.packbits(world.ravel(), bitorder='little').tobytes()
+
+    def world_from_bytes(self, data: bytes):
+        cells = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=self._size, bitorder='little')
+        return cells.reshape(self._shape)
+
+    def window_to_bytes(self, world, x: int, y: int, width: int, height: int) -> bytes:
+        return np.packbits(world[y:y + height, x:x + width].ravel(), bitorder='little').tobytes()
+
+    def pack_two_worlds_into_array(self, prev_world, cur_world):
+        """Pack two worlds (previous and current) into an uint32 array (2 bit per cell)"""
+
+        cells = np.zeros((self._size + 15) >> 4 << 4, dtype=np.uint32)
+        cells[:self._size] = (cur_world | (prev_world << 1)).ravel()
+
+        records = np.bitwise_or.reduce(cells.reshape(-1, 16) << self._pack_offsets, axis=1)
+        return array('L', records.tolist())
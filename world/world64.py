@@ -1,23 +1,91 @@
 from array import array
 from random import randint
 
-from util.bitarray import getBit
 from world import AbstractWorldFactory
+from world.canonical import (array_from_bytes, array_to_bytes, compact_bits, crop_bits, join_rows, split_rows,
+                             spread_bits)
+from world.rules import CONWAY, Rule, compile_kernel, insert_code
+
+# The next state of the record `i` (the column `c0` of the row `r0`, see `WorldFactory._columns`) in `num`, from the
+# vertical subtotals. The kernels of the packed engines are built from it (see `world.rules.insert_code`).
+NEXT_RECORD_SOURCE = """
+# The cells on the left and right edges are summed with the edge cells of the neighbour records:
+# the last cell of the left record, the first cell of the right one (the rows wrap at the exact width).
+x0 = (subtotals[i] +
+      (((subtotals[i] & 0x0FFF_FFFF_FFFF_FFFF) << 4) | (subtotals[r0 + c1] >> last_left)) +
+      ((subtotals[i] >> 4) | ((subtotals[r0 + c2] & 0xF) << last)))
+
+# ... add bit magic of the rule to get new cell states (for B3/S23: cell & x2 & ~x1 & ~x0 | ~x2 & x1 & x0)
+cell = world[i]
+{shifts}
+num = ({expression}) & mask
+"""
+
+# The calculation of the next world (see `WorldFactory.create_next_world`). The expression of the rule is inlined into
+# the loop (see `world.rules.compile_kernel`): a call of a function for each record would slow it down by half.
+# {store} puts the record `num` into the new world (the active64 engine also collects the changed records).
+NEXT_WORLD_TEMPLATE = """
+from array import array
+
+def next_world(world, new_world, row_size, size, columns, changed):
+    # Index calculating.
+    # rX - row offset
+    # cX - position in row
+    #
+    #    |   c1  |   c0  |   c2  |
+    # ---+-------+-------+-------+
+    # r1 | r1+c1 | r1+c0 | r1+c2 |
+    # ---+-------+-------+-------+
+    # r0 | r0+c1 | r0+c0 | r0+c2 |
+    # ---+-------+-------+-------+
+    # r2 | r2+c1 | r2+c0 | r2+c2 |
+    # ---+-------+-------+-------+
+
+    # The buffer is allocated on each call, so the worlds can be calculated in parallel threads
+    subtotals = array('Q', bytes(size << 3))
+
+    # Let's calculate the vertical neighbors for each 1x3 rectangle. To speed up, we sum 64-bit integer numbers
+    # instead of bits.
+
+    for r0 in range(0, size, row_size):
+        r1 = (r0 - row_size) % size
+        r2 = (r0 + row_size) % size
+        for c0 in range(row_size):
+            i = r0 + c0
+            subtotals[i] = world[i] + world[r1 + c0] + world[r2 + c0]
+
+    # Now let's sum horizontally to calculate all the cells in each 3x3 square (x0)...
+
+    for r0 in range(0, size, row_size):
+        for c0, c1, c2, last_left, last, mask in columns:
+            i = r0 + c0
+            {next_record}
+            {store}
+"""
+
+_NEXT_WORLD_SOURCE = insert_code(NEXT_WORLD_TEMPLATE, next_record=NEXT_RECORD_SOURCE, store="new_world[i] = num")
 
 
 class WorldFactory(AbstractWorldFactory):
 
-    def __init__(self, width, height):
-        super(WorldFactory, self).__init__(width, height)
+    def __init__(self, width, height, rule: Rule = CONWAY):
+        super(WorldFactory, self).__init__(width, height, rule)
 
         # To improve the performance of the world calculation, we store the world in an array of 64-bit integers,
         # allocate 4 bits per cell, and size the strings to the size of the array elements.
         self._row_size = row_size = ((width << 2) + 63) >> 6
-        self._size = size = row_size * height
-        self._subtotals = array('Q', (0,) * size)
+        self._size = row_size * height
+
+        # The row is aligned with the records, the last record of the row holds the rest of the cells (1..16), and its
+        # unused bits are always 0. For each record of the row: the record, the records on the left and right, the
+        # offsets of the last cell of the left record and of the record, the mask of the cells of the record.
+        offsets = [60] * row_size
+        offsets[-1] = ((width - 1) & 15) << 2
+        self._columns = [(c0, (c0 - 1) % row_size, (c0 + 1) % row_size, offsets[c0 - 1], offsets[c0],
+                          0x1111_1111_1111_1111 & ((2 << offsets[c0]) - 1)) for c0 in range(row_size)]
 
-        # FIXME: adjusting the width of world (to align the data row with the array elements)
-        self._width = row_size << 4
+        # The loop of `create_next_world` with the bitwise expression of the rule
+        self._next_world = compile_kernel(_NEXT_WORLD_SOURCE, 'next_world', self._rule)
 
     def is_live_cell(self, world, row, col):
         record = row * self._row_size + (col >> 4)
@@ -38,88 +106,51 @@ class WorldFactory(AbstractWorldFactory):
         return array('Q', (0,) * self._size)
 
     def create_random_world(self):
-        return array('Q', (randint(0, 0xFFFF_FFFF_FFFF_FFFF) & 0x1111_1111_1111_1111 for _ in range(self._size)))
+        masks = [column[-1] for column in self._columns] * self._height
+        return array('Q', (randint(0, 0xFFFF_FFFF_FFFF_FFFF) & mask for mask in masks))
 
     def create_next_world(self, world):
         """
-        1. Any live cell with two or three live neighbours survives.
-        2. Any dead cell with three live neighbours becomes a live cell.
+        1. Any dead cell with a number of live neighbours in the birth list of the rule becomes a live cell.
+        2. Any live cell with a number of live neighbours in the survival list of the rule survives.
         3. All other live cells die in the next generation. Similarly, all other dead cells stay dead.
 
+        For Conway's Life (B3/S23): a dead cell with three live neighbours is born, a live cell with two or three live
+        neighbours survives.
+
         https://en.wikipedia.org/wiki/Conway%27s_Game_of_Life#Rules
+        https://conwaylife.com/wiki/Life-like_cellular_automaton
         """
 
-        # Index calculating.
-        # rX - row offset
-        # cX - position in row
-        #
-        #    |   c1  |   c0  |   c2  |
-        # ---+-------+-------+-------+
-        # r1 | r1+c1 | r1+c0 | r1+c2 |
-        # ---+-------+-------+-------+
-        # r0 | r0+c1 | r0+c0 | r0+c2 |
-        # ---+-------+-------+-------+
-        # r2 | r2+c1 | r2+c0 | r2+c2 |
-        # ---+-------+-------+-------+
-
-        row_size, size, subtotals = self._row_size, self._size, self._subtotals
-        new_world = array('Q', (0,) * size)
-
-        # Let's calculate the vertical neighbors for each 1x3 rectangle. To speed up, we sum 64-bit integer numbers
-        # instead of bits.
-
-        for r0 in range(0, size, row_size):
-            r1 = (r0 - row_size) % size
-            r2 = (r0 + row_size) % size
-            for c0 in range(row_size):
-                i = r0 + c0
-                subtotals[i] = world[i] + world[r1 + c0] + world[r2 + c0]
-
-        # Now let's sum horizontally to calculate all the neighbors in each 3x3 square (x0)...
-
-        for r0 in range(0, size, row_size):
-            for c0 in range(row_size):
-                i = r0 + c0
-                i1 = r0 + (c0 - 1) % row_size
-                i2 = r0 + (c0 + 1) % row_size
-
-                x0 = (subtotals[i] +
-                      (((subtotals[i] & 0x0FFF_FFFF_FFFF_FFFF) << 4) | (subtotals[i1] >> 60)) +
-                      ((subtotals[i] >> 4) | ((subtotals[i2] & 0xF) << 60)))
-
-                # ... add bit magic to get new cell states
-                x2 = x0 >> 2
-                x1 = x0 >> 1
-                new_world[i] = (world[i] & x2 & ~x1 & ~x0 | ~x2 & x1 & x0) & 0x1111_1111_1111_1111
-
-        return new_world
-
-    def create_world_from_array(self, array_):
-        size = self._size
-        new_world = array('Q', (0,) * size)
-
-        i = 0
-        for record in range(size):
-            num = 0
-            for offset in range(0, 64, 4):
-                num |= (getBit(array_, i) << offset)
-                i += 1
-            new_world[record] = num
-
+        new_world = array('Q', bytes(self._size << 3))
+        self._next_world(world, new_world, self._row_size, self._size, self._columns, None)
         return new_world
 
-    def pack_two_worlds_into_array(self, prev_world, cur_world):
-        """Pack two worlds (previous and current) into an uint32 array (2 bit per cell)"""
-
-        result = array('L')
-
-        for num0, num1 in zip(cur_world, prev_world):
-            pack = num0 | (num1 << 1)  # ~24% of the time it's 0
-            if pack:
-                pack |= pack >> 2
-                pack = (pack & 0x000F_000F_000F_000F) | ((pack >> 4) & 0x00F0_00F0_00F0_00F0)
-                pack = (pack & 0x0000_00FF_0000_00FF) | ((pack >> 8) & 0x0000_FF00_0000_FF00)
-                pack = (pack & 0x0000_0000_0000_FFFF) | (pack >> 16)
-            result.append(pack)
-
-        return result
+    def world_to_bytes(self, world) -> bytes:
+        # The records are converted without gaps, then the dead cells that pad the rows to the records are cropped
+        data = compact_bits(array_to_bytes(world), 4)
+        aligned_width = self._row_size << 4
+        if aligned_width == self._width:
+            return data
+        return crop_bits(data, aligned_width, 0, 0, self._width, self._height)
+
+    def world_from_bytes(self, data: bytes):
+        width = self._width
+        aligned_width = self._row_size << 4
+        if aligned_width != width:
+            # the rows are padded to the records with dead cells
+            data = join_rows(split_rows(data, width, self._height), aligned_width)
+        return array_from_bytes('Q', spread_bits(data, 4))
+
+    def window_to_bytes(self, world, x: int, y: int, width: int, height: int) -> bytes:
+        # Only the records of the window are converted
+        row_size = self._row_size
+        first, last = x >> 4, ((x + width - 1) >> 4) + 1
+        shift, mask = x & 15, (1 << width) - 1
+
+        rows = []
+        for start in range(y * row_size, (y + height) * row_size, row_size):
+            bits = int.from_bytes(compact_bits(array_to_bytes(world[start + first:start + last]), 4), 'little')
+            rows.append((bits >> shift) & mask)
+
+        return join_rows(rows, width)